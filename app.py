@@ -1,109 +1,94 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta
-from collections import OrderedDict
 from config.indicators import indicators_by_category, category_order
-from data.fetcher import fetch_data, fetch_japan_bond_yield_mof
-from data.news_fetcher import fetch_market_news
 from components.selector import select_date_range
-from components.cards import render_metric_card
-from services.analyzer import generate_analysis
+from components.cards import MetricCardGrid, render_card_styles
+from components.debug_panel import render_debug_panel
+from data.news_fetcher import fetch_market_news
+from data.warmer import start_cache_warmer
+from services.analyzer import stream_analysis
+from services.indicators import iter_indicator_changes, changes_by_label, label_info
+from services.periods import fetch_window
+from services.snapshot import load_preset_snapshot
 
 st.set_page_config(page_title="世界経済ダッシュボード", layout="wide")
 st.title("🌐 世界経済ダッシュボード")
 
+# 全指標・ニュースのキャッシュをバックグラウンドで期限切れ前に更新する（プロセスで 1 度だけ起動）
+start_cache_warmer()
+
 # 日付選択
 range_option, start_date, end_date = select_date_range()
 
-label_changes = {}
-period_offsets = OrderedDict({
-    "5d": timedelta(days=7),
-    "1mo": timedelta(days=30),
-    "3mo": timedelta(days=90)
-})
+fetch_start_date, news_start, news_end = fetch_window(range_option, start_date, end_date)
 
+# 全指標のカードの枠をカテゴリごとの 1 ブロックとして先に並べ、取得が終わった指標から順に埋めていく
+render_card_styles()
+card_grids = {}
 for category in category_order:
     items = indicators_by_category.get(category, {})
     if not items:
         continue
 
     st.markdown(f"### {category}")
-    cols = st.columns(4)
-    i = 0
-
-    for label, info in items.items():
-        try:
-            if info.get("is_mof"):
-                df = fetch_japan_bond_yield_mof(start_date - timedelta(days=90), end_date, term=info.get("term", "10年"))
-            else:
-                df = fetch_data(info["ticker"], start_date - timedelta(days=90), end_date)
-
-            if df.empty:
-                st.warning(f"{label} のデータが空です。")
-                continue
-
-            df_in_range = df[df.index <= end_date]
-
-            if range_option == "前日比":
-                if len(df_in_range) < 2:
-                    st.warning(f"{label} の期間内データが不十分です。")
-                    continue
-                prev_value = df_in_range.iloc[-2, 0]
-                end_value = df_in_range.iloc[-1, 0]
-            else:
-                df_period = df[(df.index >= start_date) & (df.index <= end_date)]
-                if len(df_period) < 2:
-                    st.warning(f"{label} の指定期間データが不十分です。")
-                    continue
-                prev_value = df_period.iloc[0, 0]
-                end_value = df_period.iloc[-1, 0]
-
-            history_changes = {}
-            for key, offset in period_offsets.items():
-                hist_start = end_date - offset
-                df_hist = df[(df.index >= hist_start) & (df.index <= end_date)]
-                if len(df_hist) >= 2:
-                    v0 = df_hist.iloc[0, 0]
-                    v1 = df_hist.iloc[-1, 0]
-                    if category == "国債":
-                        history_changes[key] = v1 - v0
-                    else:
-                        history_changes[key] = ((v1 - v0) / v0) * 100
-
-            if category == "国債":
-                range_change = end_value - prev_value
-                change_text = f"{range_change:+.2f}%"
-            else:
-                range_change = ((end_value - prev_value) / prev_value) * 100
-                change_text = f"{range_change:+.2f}%（変化率）"
-
-            history_changes["range"] = range_change
-            label_changes[label] = history_changes
-
-            last_date = df_in_range.index[-1].tz_localize("UTC").tz_convert("Asia/Tokyo").strftime("%Y-%m-%d")
-
-            with cols[i % 4]:
-                render_metric_card(label, f"{end_value:.2f}", range_change, change_text, last_date)
-            i += 1
-
-        except Exception as e:
-            st.warning(f"{label} の取得中にエラーが発生しました: {e}")
-
-if range_option == "前日比":
-    news_start = datetime.combine(end_date.date() - timedelta(days=1), datetime.min.time())
-    news_end = datetime.combine(end_date.date() + timedelta(days=1), datetime.min.time())
+    card_grids[category] = MetricCardGrid(category, list(items), params=(range_option, start_date, end_date))
+
+def fill_card(label, result):
+    category = label_info(label)["category"]
+    if "error" in result:
+        card_grids[category].set_warning(label, f"{label} {result['error']}")
+        return
+
+    range_change = result["range"]
+    if category == "国債":
+        change_text = f"{range_change:+.2f}%"
+    else:
+        change_text = f"{range_change:+.2f}%（変化率）"
+
+    last_date = pd.Timestamp(result["last_date"]).tz_localize("UTC").tz_convert("Asia/Tokyo").strftime("%Y-%m-%d")
+    card_grids[category].set_card(
+        label, f"{result['end_value']:.2f}", range_change, change_text, last_date, stale=result.get("stale", False)
+    )
+
+# プリセットの期間は事前計算済みのスナップショットがあればそれを表示する（カスタムは常にその場で計算）
+snapshot = load_preset_snapshot(range_option, start_date, end_date)
+
+if snapshot is not None:
+    indicator_results = snapshot["indicators"]
+    for label, result in indicator_results.items():
+        fill_card(label, result)
+    for grid in card_grids.values():
+        grid.flush()
+
+    if "news" in snapshot:
+        news_summaries = snapshot["news"]
+    else:
+        news_summaries = fetch_market_news(news_start, news_end)
+
 else:
-    news_start = start_date
-    news_end = end_date + timedelta(days=1)
+    # 指標（カテゴリごとの一括取得）・MOF 利回り・ニュースを並列に取得し、届いた分のカテゴリのブロックだけを描画し直す
+    indicator_results = {}
+    news_summaries = []
+    for name, payload in iter_indicator_changes(start_date, end_date, range_option, fetch_start_date, (news_start, news_end)):
+        if name == "news":
+            news_summaries = payload
+            continue
+
+        for label, result in payload.items():
+            fill_card(label, result)
+        indicator_results.update(payload)
 
-news_summaries = fetch_market_news(news_start, news_end)
+        for category in {label_info(label)["category"] for label in payload}:
+            card_grids[category].flush()
+
+label_changes = changes_by_label(indicator_results)
 
 st.markdown("---")
 st.markdown("### 🤖 ChatGPTによる市場分析コメント")
 st.info("個別指標の変化率と最近のニュースをもとに、世界経済の動向を自動で分析します。")
 
-comment = generate_analysis(label_changes, news_summaries, start_date, end_date)
-st.markdown(comment)
+# 生成中のテキストを逐次表示
+st.write_stream(stream_analysis(label_changes, news_summaries, start_date, end_date))
 
 def parse_summary(summary):
     try:
@@ -139,3 +124,6 @@ if not df_news.empty:
         unsafe_allow_html=True
     )
     st.table(df_news)
+
+# 取得の計測パネル（DEBUG_PANEL=1 または ?debug=1 の場合だけ表示）。このページの取得を含めるため最後に描画する
+render_debug_panel()
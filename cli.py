@@ -0,0 +1,110 @@
+import argparse
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+from services.periods import PRESET_OPTIONS, CUSTOM_PRESET, preset_range
+from services.snapshot import MATERIALIZED_PATH, compute_snapshot, materialize, write_snapshot
+
+# Streamlit を起動せずにダッシュボードのスナップショットを計算する
+#   python cli.py snapshot --range 1か月 -o snapshot.json
+#   python cli.py snapshot --start 2024-01-01 --end 2024-03-31 --analysis -o snapshot.parquet
+#   python cli.py materialize --analysis   （データ更新後に定期実行し、ダッシュボードはこの結果を表示する）
+#   python cli.py bench-startup --reruns 5   （各ページの import 時間と再実行時間を測る）
+#   python cli.py --metrics metrics.prom materialize   （取得の計測結果を Prometheus 形式で書き出す）
+
+
+def _parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+def _snapshot(args):
+    if args.start or args.end:
+        if not (args.start and args.end):
+            raise SystemExit("--start と --end は両方指定してください。")
+        range_option, start_date, end_date = CUSTOM_PRESET, args.start, args.end
+    else:
+        range_option = args.range
+        start_date, end_date = preset_range(range_option)
+
+    snapshot = compute_snapshot(range_option, start_date, end_date, with_analysis=args.analysis)
+    if args.output:
+        write_snapshot(snapshot, args.output, fmt=args.format)
+    else:
+        json.dump(snapshot, sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write("\n")
+
+
+def _materialize(args):
+    snapshots = materialize(args.output, with_analysis=args.analysis)
+    logging.getLogger(__name__).info("%d 件のプリセットを %s に書き出しました。", len(snapshots), args.output)
+
+
+def _bench_startup(args):
+    # Streamlit を読み込むため、このコマンドを使う時だけ読み込む
+    from utils.startup_bench import ENTRY_POINTS, run_benchmark
+
+    results = run_benchmark(args.entry_points or ENTRY_POINTS, runs=args.runs, reruns=args.reruns)
+    if args.json:
+        json.dump(results, sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write("\n")
+        return
+    for result in results:
+        line = f"{result['entry_point']}: cold {result['cold_ms']:.0f} ms"
+        if "rerun_ms" in result:
+            line += f", rerun {result['rerun_ms']:.0f} ms"
+        print(line)
+        print(f"  heavy modules loaded: {', '.join(result['heavy_modules']) or '-'}")
+        for module, ms in result["top_imports_ms"]:
+            print(f"  {module}: {ms:.0f} ms")
+
+
+def _write_metrics(path):
+    # node_exporter の textfile collector から読めるよう、一時ファイルに書いてから置き換える
+    from data.metrics import metrics
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(metrics.to_prometheus())
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="世界経済ダッシュボードのコマンドラインツール")
+    parser.add_argument("--metrics", help="終了時に取得の計測結果を Prometheus のテキスト形式で書き出すファイル")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    snapshot = subparsers.add_parser("snapshot", help="全指標の変化（と分析コメント）を計算して保存する")
+    presets = [name for name in PRESET_OPTIONS if name != CUSTOM_PRESET]
+    snapshot.add_argument("--range", choices=presets, default=presets[0], help="表示期間のプリセット")
+    snapshot.add_argument("--start", type=_parse_date, help="開始日（YYYY-MM-DD、--end と併用）")
+    snapshot.add_argument("--end", type=_parse_date, help="終了日（YYYY-MM-DD）")
+    snapshot.add_argument("--analysis", action="store_true", help="ニュースを取得して ChatGPT の分析コメントも生成する")
+    snapshot.add_argument("-o", "--output", help="出力先（.json / .parquet）。省略時は標準出力に JSON")
+    snapshot.add_argument("--format", choices=["json", "parquet"], help="出力形式（省略時は拡張子から判断）")
+    snapshot.set_defaults(func=_snapshot)
+
+    materialize_parser = subparsers.add_parser("materialize", help="カスタム以外の全プリセットのスナップショットを事前計算する")
+    materialize_parser.add_argument("--analysis", action="store_true", help="分析コメントも生成してキャッシュしておく")
+    materialize_parser.add_argument("-o", "--output", default=MATERIALIZED_PATH, help="出力先の Parquet ファイル")
+    materialize_parser.set_defaults(func=_materialize)
+
+    bench = subparsers.add_parser("bench-startup", help="各エントリポイントのコールドスタートと再実行の時間を測る")
+    bench.add_argument("entry_points", nargs="*", help="対象のスクリプト（省略時は app.py と全ページ）")
+    bench.add_argument("--runs", type=int, default=5, help="コールドスタートの計測回数")
+    bench.add_argument("--reruns", type=int, default=0, help="再実行の計測回数（0 なら再実行は測らない）")
+    bench.add_argument("--json", action="store_true", help="結果を JSON で出力する")
+    bench.set_defaults(func=_bench_startup)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
+        args.func(args)
+    finally:
+        if args.metrics:
+            _write_metrics(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
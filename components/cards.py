@@ -1,6 +1,37 @@
 import streamlit as st
+from html import escape
 from urllib.parse import quote
 
+# カードの共通スタイル。各カードには背景色だけをインラインで持たせる
+CARD_STYLE = """
+<style>
+.metric-grid {
+    display: grid;
+    grid-template-columns: repeat(var(--metric-columns, 4), minmax(0, 1fr));
+}
+.metric-card {
+    padding: 1rem 1.2rem;
+    border-radius: 0.5rem;
+    text-align: left;
+    margin: 0.5rem;
+    border: 1px solid #e6e6e6;
+}
+.metric-card .metric-label { font-weight: 600; font-size: 1rem; }
+.metric-card .metric-value { font-size: 1.4rem; font-weight: 700; color: #1c1c1c; }
+.metric-card .metric-value.up { color: #006400; }
+.metric-card .metric-value.down { color: #8B0000; }
+.metric-card .metric-value.pending { color: #999; }
+.metric-card .metric-change { font-size: 0.9rem; color: #5c5c5c; margin-top: 0.3rem; }
+.metric-card .metric-date { font-size: 0.8rem; color: #999; margin-top: 0.3rem; }
+.metric-card .metric-stale { color: #b36b00; }
+.metric-card .metric-link { margin-top: 0.4rem; }
+.metric-card .metric-link a { text-decoration: none; }
+.metric-card.warning { background-color: rgba(255, 200, 0, 0.15); }
+</style>
+"""
+
+_GRID_STATE_KEY = "metric_card_grids"
+
 def get_color_by_change(change):
     try:
         c = float(change)
@@ -14,31 +45,82 @@ def get_color_by_change(change):
     else:
         return "rgba(200, 200, 200, 0.2)"
 
-def render_metric_card(label, value, change, change_text, last_date):
+def metric_card_html(label, value, change, change_text, last_date, stale=False):
     color = get_color_by_change(change)
     try:
         c = float(change)
     except:
         c = 0.0
-    value_color = "#006400" if c > 0 else "#8B0000" if c < 0 else "#1c1c1c"
+    value_class = "up" if c > 0 else "down" if c < 0 else ""
     label_encoded = quote(label)
+    stale_note = "<span class='metric-stale'>（取得失敗のため前回のデータ）</span>" if stale else ""
+
+    return (
+        f"<div class='metric-card' style='background-color: {color};'>"
+        f"<div class='metric-label'>{label}</div>"
+        f"<div class='metric-value {value_class}'>{float(value):,.2f}</div>"
+        f"<div class='metric-change'>{change_text}</div>"
+        f"<div class='metric-date'>更新日: {last_date}{stale_note}</div>"
+        f"<div class='metric-link'><a href=\"/detail_chart?symbol={label_encoded}\">📈 詳細グラフへ</a></div>"
+        f"</div>"
+    )
+
+def placeholder_card_html(label):
+    # データ取得中に表示する仮のカード
+    return (
+        f"<div class='metric-card' style='background-color: rgba(200, 200, 200, 0.2);'>"
+        f"<div class='metric-label'>{label}</div>"
+        f"<div class='metric-value pending'>…</div>"
+        f"<div class='metric-change'>読み込み中</div>"
+        f"</div>"
+    )
+
+def warning_card_html(label, message):
+    return (
+        f"<div class='metric-card warning'>"
+        f"<div class='metric-label'>{label}</div>"
+        f"<div class='metric-change'>⚠️ {escape(str(message))}</div>"
+        f"</div>"
+    )
+
+def render_card_styles():
+    # ページ内で 1 回だけ呼ぶ
+    st.markdown(CARD_STYLE, unsafe_allow_html=True)
+
+
+class MetricCardGrid:
+    # カテゴリ内の全カードを 1 つの HTML ブロックとして描画する。
+    # 内容が直前に送ったものと同じなら送り直さず、同じ条件での再実行時は前回の表示から始める
+    def __init__(self, key, labels, params=None, columns=4):
+        self.key = key
+        self.params = params
+        self.columns = columns
+        self._slot = st.empty()
+        self._sent_html = None
+
+        previous = st.session_state.get(_GRID_STATE_KEY, {}).get(key)
+        previous_cards = previous[1] if previous and previous[0] == params else {}
+        self._cards = {label: previous_cards.get(label) or placeholder_card_html(label) for label in labels}
+        self._render()
+
+    def set_card(self, label, value, change, change_text, last_date, stale=False):
+        self._cards[label] = metric_card_html(label, value, change, change_text, last_date, stale)
+
+    def set_warning(self, label, message):
+        self._cards[label] = warning_card_html(label, message)
+
+    def flush(self):
+        self._render()
+        grids = st.session_state.setdefault(_GRID_STATE_KEY, {})
+        grids[self.key] = (self.params, dict(self._cards))
 
-    html = f"""
-    <div style='
-        background-color: {color};
-        padding: 1rem 1.2rem;
-        border-radius: 0.5rem;
-        text-align: left;
-        margin: 0.5rem;
-        border: 1px solid #e6e6e6;
-    '>
-        <div style='font-weight: 600; font-size: 1rem;'>{label}</div>
-        <div style='font-size: 1.4rem; font-weight: 700; color: {value_color};'>{float(value):,.2f}</div>
-        <div style='font-size: 0.9rem; color: #5c5c5c; margin-top: 0.3rem;'>{change_text}</div>
-        <div style='font-size: 0.8rem; color: #999; margin-top: 0.3rem;'>更新日: {last_date}</div>
-        <div style='margin-top: 0.4rem;'>
-            <a href="/detail_chart?symbol={label_encoded}" style='text-decoration: none;'>📈 詳細グラフへ</a>
-        </div>
-    </div>
-    """
-    st.markdown(html, unsafe_allow_html=True)
+    def _render(self):
+        html = (
+            f"<div class='metric-grid' style='--metric-columns: {self.columns};'>"
+            + "".join(self._cards.values())
+            + "</div>"
+        )
+        if html == self._sent_html:
+            return
+        self._slot.markdown(html, unsafe_allow_html=True)
+        self._sent_html = html
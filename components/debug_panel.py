@@ -0,0 +1,134 @@
+import os
+from datetime import datetime
+import streamlit as st
+from data.metrics import metrics
+from data.warmer import cache_warmer
+
+# サイドバーの計測パネル。DEBUG_PANEL=1 を設定するか、URL に ?debug=1 を付けた場合だけ表示する
+DEBUG_PANEL_ENABLED = os.environ.get("DEBUG_PANEL", "0") == "1"
+SLOW_KEYS = 10  # 平均所要時間の長い順に表示するティッカー・年限の数
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def _call_rows():
+    # 取得関数ごとの呼び出し回数・ヒット率・所要時間・再試行・行数・バイト数
+    calls = metrics.counters("fetch_calls_total")
+    durations = metrics.histograms("fetch_duration_seconds")
+    retries = metrics.counters("fetch_retries_total")
+    stale = metrics.counters("fetch_stale_total")
+    rows = metrics.counters("fetch_rows_total")
+    nbytes = metrics.counters("fetch_bytes_total")
+
+    ops = {}
+    for labels, count in calls.items():
+        labels = dict(labels)
+        op = ops.setdefault(labels["op"], {"calls": 0, "hit": 0, "errors": 0})
+        op["calls"] += count
+        if labels["cache"] == "hit":
+            op["hit"] += count
+        if labels["outcome"] == "error":
+            op["errors"] += count
+
+    table = []
+    for op, counts in sorted(ops.items()):
+        op_labels = (("op", op),)
+        histograms = [h for labels, h in durations.items() if dict(labels)["op"] == op]
+        total = sum(h.sum for h in histograms)
+        count = sum(h.count for h in histograms)
+        table.append({
+            "関数": op,
+            "呼び出し": counts["calls"],
+            "ヒット率": f"{counts['hit'] / counts['calls']:.0%}" if counts["calls"] else "-",
+            "平均 (ms)": _ms(total / count) if count else None,
+            "最大 (ms)": _ms(max((h.max for h in histograms), default=None)),
+            "エラー": counts["errors"],
+            "再試行": retries.get(op_labels, 0),
+            "古いデータ": stale.get(op_labels, 0),
+            "行数": rows.get(op_labels, 0),
+            "バイト数": nbytes.get(op_labels, 0),
+        })
+    return table
+
+
+def _slow_key_rows(limit=SLOW_KEYS):
+    table = []
+    for labels, histogram in metrics.histograms("fetch_key_duration_seconds").items():
+        labels = dict(labels)
+        table.append({
+            "関数": labels["op"],
+            "キー": labels["key"],
+            "回数": histogram.count,
+            "平均 (ms)": _ms(histogram.sum / histogram.count),
+            "最大 (ms)": _ms(histogram.max),
+        })
+    return sorted(table, key=lambda row: row["平均 (ms)"], reverse=True)[:limit]
+
+
+def _upstream_rows():
+    requests = metrics.counters("upstream_requests_total")
+    durations = metrics.histograms("upstream_duration_seconds")
+    retries = metrics.counters("upstream_retries_total")
+    nbytes = metrics.counters("upstream_bytes_total")
+
+    sources = sorted({dict(labels)["source"] for labels in list(requests) + list(nbytes)})
+    table = []
+    for source in sources:
+        source_labels = (("source", source),)
+        outcomes = {dict(labels)["outcome"]: count for labels, count in requests.items() if dict(labels)["source"] == source}
+        histogram = durations.get(source_labels)
+        table.append({
+            "取得元": source,
+            "成功": outcomes.get("ok", 0),
+            "失敗": outcomes.get("error", 0),
+            "遮断": outcomes.get("rejected", 0),
+            "再試行": retries.get(source_labels, 0),
+            "p50 (ms)": _ms(histogram.quantile(0.5)) if histogram else None,
+            "p95 (ms)": _ms(histogram.quantile(0.95)) if histogram else None,
+            "バイト数": nbytes.get(source_labels, 0),
+        })
+    return table
+
+
+def _time(timestamp):
+    return None if timestamp is None else datetime.fromtimestamp(timestamp).strftime("%H:%M:%S")
+
+
+def _warmer_rows():
+    # キャッシュの事前更新ジョブごとの前回の実行結果と次回の予定
+    return [
+        {
+            "ジョブ": name,
+            "前回": _time(run.get("started_at")),
+            "所要 (ms)": _ms(run.get("duration")),
+            "エラー": run.get("error"),
+            "次回": _time(run.get("next_run_at")),
+        }
+        for name, run in cache_warmer.stats().items()
+    ]
+
+
+def render_debug_panel():
+    if not (DEBUG_PANEL_ENABLED or st.query_params.get("debug") == "1"):
+        return
+
+    with st.sidebar.expander("🛠 取得の計測", expanded=False):
+        st.markdown("**取得関数**")
+        st.dataframe(_call_rows(), hide_index=True, use_container_width=True)
+        st.markdown(f"**時間のかかるキー（上位 {SLOW_KEYS} 件）**")
+        st.dataframe(_slow_key_rows(), hide_index=True, use_container_width=True)
+        st.markdown("**取得元**")
+        st.dataframe(_upstream_rows(), hide_index=True, use_container_width=True)
+        st.markdown("**事前更新**")
+        st.dataframe(_warmer_rows(), hide_index=True, use_container_width=True)
+        st.markdown("**キャッシュ・ストア・ブレーカー**")
+        st.dataframe(
+            [{"名前": name, "ラベル": ", ".join(f"{k}={v}" for k, v in labels.items()), "値": value}
+             for name, labels, value in metrics.gauges()],
+            hide_index=True, use_container_width=True,
+        )
+        st.download_button("Prometheus 形式で保存", metrics.to_prometheus(), file_name="metrics.prom", mime="text/plain")
+        if st.button("計測をリセット"):
+            metrics.reset()
@@ -59,4 +59,32 @@ category_order = [
     "為替"
 ]
 
-__all__ = ["indicators_by_category", "category_order"]
+# yfinance から一括取得する（MOF 以外の）ティッカー一覧
+yfinance_tickers = [
+    info["ticker"]
+    for items in indicators_by_category.values()
+    for info in items.values()
+    if not info.get("is_mof")
+]
+
+# 以下はページの再実行ごとに作り直さないよう、読み込み時に 1 度だけ作る逆引き表
+# ラベル → カテゴリ付きの指標情報
+label_to_info = {
+    label: {**info, "category": category}
+    for category, items in indicators_by_category.items()
+    for label, info in items.items()
+}
+
+# ダッシュボードの表示順（カテゴリ順 → 設定順）
+ordered_labels = [label for category in category_order for label in indicators_by_category.get(category, {})]
+
+# グラフページで最初に選択しておく指標
+default_labels = [label for label, info in label_to_info.items() if info.get("default", False)]
+
+# 変化率ではなく差分で表す（利回りの）指標
+bond_labels = list(indicators_by_category.get("国債", {}))
+
+__all__ = [
+    "indicators_by_category", "category_order", "yfinance_tickers",
+    "label_to_info", "ordered_labels", "default_labels", "bond_labels",
+]
@@ -1,37 +1,276 @@
-import yfinance as yf
+import numpy as np
 import pandas as pd
-import streamlit as st
-from datetime import datetime
+from datetime import datetime, timedelta
+import logging
 import re
 import time
+from data import store
+from data.metrics import instrumented, metrics, note_cache_result
+from data.series_cache import CompactSeries, series_cache
+from data.resilience import NegativeCache, call_with_retry
+from data.shared_cache import FrameCodec, shared_cache, shared_lock
+from data.singleflight import single_flight
 
-@st.cache_data(ttl=3600)  # 1時間キャッシュ
-def fetch_data(ticker, start_date, end_date, retries=3, delay=2):
-    for attempt in range(retries):
+logger = logging.getLogger(__name__)
+
+YF_MAX_AGE = 3600  # 1時間キャッシュ（末尾データの再取得間隔）
+MOF_MAX_AGE = 86400  # 1日キャッシュ
+NEGATIVE_TTL = 300  # データが返らなかったティッカーを取得し直さない秒数
+STALE_TTL = 60  # 取得に失敗して保存済みのデータを返す場合のキャッシュ期間
+ADJUSTMENT_TOLERANCE = 1e-4  # 重ねて取得した日の値と保存済みの値の比（相対誤差）の許容幅
+MOF_HISTORY_START = pd.Timestamp("1970-01-01")  # 利回りは全期間をキャッシュするので、これ以降の要求はすべてキャッシュで返す
+
+MOF_URL_ALL = "https://www.mof.go.jp/jgbs/reference/interest_rate/data/jgbcm_all.csv"
+MOF_URL_CURRENT = "https://www.mof.go.jp/jgbs/reference/interest_rate/jgbcm.csv"
+
+_no_data = NegativeCache(NEGATIVE_TTL)
+
+def _yf_key(ticker):
+    return f"yf:{ticker}"
+
+def _mof_key(term):
+    return f"mof:{term}"
+
+def _extract_close(df, ticker):
+    # MultiIndex の場合はフラット化
+    if isinstance(df.columns, pd.MultiIndex):
         try:
-            df = yf.download(ticker, start=start_date, end=end_date, progress=False)
+            df = df.xs(ticker, level=1, axis=1)
+        except KeyError:
+            raise ValueError(f"{ticker} のデータが見つかりません。")
 
-            # MultiIndex の場合はフラット化
-            if isinstance(df.columns, pd.MultiIndex):
-                try:
-                    df = df.xs(ticker, level=1, axis=1)
-                except KeyError:
-                    raise ValueError(f"{ticker} のデータが見つかりません。")
+    if 'Close' not in df.columns:
+        raise ValueError(f"{ticker} の終値データが存在しません。")
+
+    df = df[['Close']].dropna()
+    df.index = pd.to_datetime(df.index)
+    df.index.name = "date"
+    return df
+
+def _cache_range(key, fetch_start, fetch_end, ttl, stale=False):
+    # ストアから取得範囲全体を読み込み、キャッシュに載せる。
+    # stale は取得に失敗して保存済みのデータを返す場合で、印を付け、復旧後すぐ取り直せるよう短い期間だけキャッシュする
+    series = CompactSeries.from_series(store.load_series(key, fetch_start, fetch_end), stale=stale)
+    if stale:
+        ttl = min(ttl, STALE_TTL)
+    series_cache.put(key, series, fetch_start, fetch_end, ttl)
+    return series
+
+def _load_range(key, fetch_start, fetch_end, ttl, update):
+    # update は取得に失敗した場合に False を返す。他のプロセスが同じ系列を取得中なら終わるのを待ち、ストアの更新分を使う
+    with shared_lock(key):
+        fresh = update(fetch_start, fetch_end)
+    if _no_data.get(key) is not None:
+        ttl = min(ttl, NEGATIVE_TTL)
+    return fetch_start, fetch_end, _cache_range(key, fetch_start, fetch_end, ttl, stale=not fresh)
 
-            if 'Close' not in df.columns:
-                raise ValueError(f"{ticker} の終値データが存在しません。")
+def _get_series(key, start_date, end_date, ttl, update):
+    series = series_cache.get(key, start_date, end_date)
+    if series is not None:
+        return series
 
-            df = df[['Close']].dropna()
-            df.index = pd.to_datetime(df.index)
-            df.index.name = "date"
+    start, end = store.to_day(start_date), store.to_day(end_date)
+    while True:
+        # キャッシュ済みの範囲を置き換えずに広げて取得する。同じ系列の取得が実行中なら合流する
+        fetch_start, fetch_end = series_cache.extend_range(key, start, end)
+        loaded_start, loaded_end, series = single_flight.do(key, _load_range, key, fetch_start, fetch_end, ttl, update)
+        if loaded_start <= start and end <= loaded_end:
+            return series.slice(start, end)
+
+def _download(tickers, start_date, end_date, retries, delay):
+    # ブレーカー・ジッター付き指数バックオフで yfinance から取得する
+    import yfinance as yf  # 読み込みに時間がかかるため、初めてダウンロードする時に読み込む
+
+    def download():
+        if isinstance(tickers, str):
+            df = yf.download(tickers, start=start_date, end=end_date, progress=False)
+            metrics.inc("upstream_bytes_total", int(df.memory_usage(deep=True).sum()), source="yfinance")
             return df
+        df = yf.download(tickers, start=start_date, end=end_date, progress=False, group_by="column")
+        metrics.inc("upstream_bytes_total", int(df.memory_usage(deep=True).sum()), source="yfinance")
+        # yfinance は障害時も例外を出さずに空の結果を返すため、複数ティッカーがすべて空なら失敗として扱う
+        if df.empty and len(tickers) > 1:
+            raise ValueError("yfinance から空の結果が返されました。")
+        return df
+
+    return call_with_retry("yfinance", download, retries=retries, base_delay=delay)
 
+def _adjustment_changed(key, close):
+    # 末尾を重ねて取得した日の値を保存済みの値と比べ、過去分の調整（配当・分割）が変わったかを判定する。
+    # 重なる日のうち最新の日（暫定値が改訂されうる）を除き、すべての日が同じ比率でずれている場合だけ調整とみなす。
+    # 一部の日だけの改訂は重なる日の上書きで済ませる
+    if close.empty:
+        return False
+    close = close.copy()
+    close.index = close.index.normalize()
+    stored = store.load_series(key, close.index.min(), close.index.max() + timedelta(days=1))
+    common = stored.index.intersection(close.index)[:-1]
+    if len(common) < 2:
+        # 1 日分だけでは改訂か調整かを区別できない
+        return False
+    ratios = close[common].to_numpy(dtype="float64") / stored[common].to_numpy()
+    ratio = np.median(ratios)
+    return abs(ratio - 1) > ADJUSTMENT_TOLERANCE and np.allclose(ratios, ratio, rtol=ADJUSTMENT_TOLERANCE, atol=0)
+
+def _save_close(ticker, close, fetch_start, fetch_end, retries, delay):
+    # 取得した終値を保存する（重なる日は上書き）。調整が変わっていれば取得済みの全期間を取り直して置き換える
+    key = _yf_key(ticker)
+    coverage = store.get_coverage(key)
+    if coverage is not None and fetch_start > coverage.start and _adjustment_changed(key, close):
+        logger.info("%s の過去分の調整が変わったため、%s 以降を取り直します。", ticker, coverage.start.date())
+        df = _extract_close(_download(ticker, coverage.start, fetch_end, retries, delay), ticker)
+        close, fetch_start = df["Close"], coverage.start
+    store.save_series(key, close, fetch_start, fetch_end)
+
+def _update_yf_store(ticker, start_date, end_date, retries, delay):
+    # ストアにない期間（主に前回取得以降の末尾）だけをダウンロードして追記する。取得に失敗した場合は False を返す
+    key = _yf_key(ticker)
+    for fetch_start, fetch_end in store.missing_ranges(key, start_date, end_date, max_age=YF_MAX_AGE):
+        try:
+            df = _download(ticker, fetch_start, fetch_end, retries, delay)
         except Exception as e:
-            if attempt < retries - 1:
-                time.sleep(delay)
-            else:
-                st.warning(f"{ticker} のデータ取得に繰り返し失敗しました。エラー内容: {e}")
-                return pd.DataFrame()
+            logger.warning("%s のデータ取得に繰り返し失敗しました。保存済みのデータを返します。エラー内容: %s", ticker, e)
+            return False
+
+        try:
+            df = _extract_close(df, ticker)
+        except ValueError:
+            df = pd.DataFrame()
+        if df.empty and store.get_coverage(key) is None:
+            # データが返らないティッカー（上場廃止・誤入力など）はしばらく取得を試みない
+            _no_data.add(key, "データが返されませんでした。")
+            return True
+        close = df["Close"] if not df.empty else pd.Series(dtype="float64")
+        try:
+            _save_close(ticker, close, fetch_start, fetch_end, retries, delay)
+        except Exception as e:
+            logger.warning("%s のデータ取得に繰り返し失敗しました。保存済みのデータを返します。エラー内容: %s", ticker, e)
+            return False
+    return True
+
+def _update_yf_store_batch(fetch_ranges, chunk_size, retries, delay, max_age=YF_MAX_AGE):
+    # 取得が必要な期間ごとにティッカーをまとめて一括ダウンロードし、
+    # (取得できなかったティッカー, 取得に失敗したため保存済みのデータを返すティッカー) を返す
+    if not fetch_ranges:
+        return set(), set()
+    # 他のプロセスが同じティッカー群を取得中なら終わるのを待ち、ストアに残りの不足分がある場合だけ取得する
+    with shared_lock("yf-batch:" + ",".join(sorted(fetch_ranges))):
+        return _update_yf_store_chunks(fetch_ranges, chunk_size, retries, delay, max_age)
+
+def _update_yf_store_chunks(fetch_ranges, chunk_size, retries, delay, max_age):
+    pending = {}
+    for ticker, (start_date, end_date) in fetch_ranges.items():
+        for fetch_range in store.missing_ranges(_yf_key(ticker), start_date, end_date, max_age=max_age):
+            pending.setdefault(fetch_range, []).append(ticker)
+
+    failed = set()
+    stale = set()
+    for (fetch_start, fetch_end), group in pending.items():
+        for i in range(0, len(group), chunk_size):
+            chunk = group[i:i + chunk_size]
+            try:
+                df = _download(chunk, fetch_start, fetch_end, retries, delay)
+            except Exception as e:
+                logger.warning("一括取得に失敗しました（%s）。エラー内容: %s", ", ".join(chunk), e)
+                for ticker in chunk:
+                    if store.get_coverage(_yf_key(ticker)) is None:
+                        failed.add(ticker)
+                    else:
+                        stale.add(ticker)
+                continue
+
+            for ticker in chunk:
+                try:
+                    df_ticker = _extract_close(df, ticker)
+                except Exception:
+                    df_ticker = pd.DataFrame()
+                # 空の結果は、既存データがあれば「新しい行なし」、なければ取得失敗とみなす
+                if df_ticker.empty and store.get_coverage(_yf_key(ticker)) is None:
+                    failed.add(ticker)
+                    continue
+                close = df_ticker["Close"] if not df_ticker.empty else pd.Series(dtype="float64")
+                try:
+                    _save_close(ticker, close, fetch_start, fetch_end, retries, delay)
+                except Exception as e:
+                    logger.warning("%s の全期間の取り直しに失敗しました。エラー内容: %s", ticker, e)
+                    stale.add(ticker)
+
+    return failed, stale
+
+@instrumented("fetch_data", key=lambda ticker, *args, **kwargs: ticker)
+def fetch_data(ticker, start_date, end_date, retries=3, delay=2):
+    if _no_data.get(_yf_key(ticker)) is not None:
+        note_cache_result("negative")
+        return pd.DataFrame()
+
+    def update(fetch_start, fetch_end):
+        return _update_yf_store(ticker, fetch_start, fetch_end, retries, delay)
+
+    return _get_series(_yf_key(ticker), start_date, end_date, YF_MAX_AGE, update).to_frame("Close")
+
+def _fetch_batch(tickers, start_date, end_date, chunk_size, retries, delay):
+    results = {}
+    fetch_ranges = {}
+    for ticker in tickers:
+        if _no_data.get(_yf_key(ticker)) is not None:
+            results[ticker] = pd.DataFrame()
+            continue
+        series = series_cache.get(_yf_key(ticker), start_date, end_date)
+        if series is not None:
+            results[ticker] = series.to_frame("Close")
+        else:
+            fetch_ranges[ticker] = series_cache.extend_range(_yf_key(ticker), start_date, end_date)
+
+    if fetch_ranges:
+        note_cache_result("partial" if len(fetch_ranges) < len(tickers) else "miss")
+    else:
+        note_cache_result("hit")
+
+    failed, stale = _update_yf_store_batch(fetch_ranges, chunk_size, retries, delay)
+
+    for ticker, (fetch_start, fetch_end) in fetch_ranges.items():
+        if ticker in failed:
+            # 一括取得で欠けたティッカーは個別取得にフォールバック
+            results[ticker] = fetch_data(ticker, start_date, end_date, retries=retries, delay=delay)
+        else:
+            series = _cache_range(_yf_key(ticker), fetch_start, fetch_end, YF_MAX_AGE, stale=ticker in stale)
+            results[ticker] = series.slice(start_date, end_date).to_frame("Close")
+
+    return {ticker: results[ticker] for ticker in tickers}
+
+@instrumented("fetch_data_batch")
+def fetch_data_batch(tickers, start_date, end_date, chunk_size=20, retries=3, delay=2):
+    # 複数ティッカーをまとめてダウンロードし、ティッカーごとの DataFrame に分割する
+    tickers = list(dict.fromkeys(tickers))
+    # 同じ一括取得が複数セッションから同時に呼ばれた場合は 1 回にまとめる
+    key = ("batch", tuple(tickers), store.to_day(start_date), store.to_day(end_date))
+    return single_flight.do(key, _fetch_batch, tickers, start_date, end_date, chunk_size, retries, delay)
+
+def refresh_data_batch(tickers, start_date, end_date, max_age, chunk_size=20, retries=3, delay=2):
+    # キャッシュの期限切れを待たずに、ストアの更新から max_age 秒以上経ったティッカーを取り直してキャッシュに載せ直す。
+    # 期限切れ直後のリクエストが取得を待たされないよう、バックグラウンドで先回りして呼ぶ
+    stale_tickers = []
+    for ticker in dict.fromkeys(tickers):
+        coverage = store.get_coverage(_yf_key(ticker))
+        if coverage is None or time.time() - coverage.updated_at > max_age:
+            stale_tickers.append(ticker)
+
+    fetch_ranges = {ticker: series_cache.extend_range(_yf_key(ticker), start_date, end_date) for ticker in stale_tickers}
+    failed, stale = _update_yf_store_batch(fetch_ranges, chunk_size, retries, delay, max_age=max_age)
+    # 取得に失敗したティッカーは、キャッシュ中の最新データを古いデータで置き換えない
+    for ticker, (fetch_start, fetch_end) in fetch_ranges.items():
+        if ticker not in failed and ticker not in stale:
+            _cache_range(_yf_key(ticker), fetch_start, fetch_end, YF_MAX_AGE)
+    return failed | stale
+
+ERA_OFFSET = {
+    "M": 1867,  # 明治
+    "T": 1911,  # 大正
+    "S": 1925,  # 昭和
+    "H": 1988,  # 平成
+    "R": 2018,  # 令和
+    "E": 2018,  # Excel変換用
+}
 
 def convert_wareki_to_datetime(wareki_str):
     if not isinstance(wareki_str, str):
@@ -42,56 +281,98 @@ def convert_wareki_to_datetime(wareki_str):
     era, year, month, day = match.groups()
     year, month, day = int(year), int(month), int(day)
 
-    era_offset = {
-        "M": 1867,  # 明治
-        "T": 1911,  # 大正
-        "S": 1925,  # 昭和
-        "H": 1988,  # 平成
-        "R": 2018,  # 令和
-        "E": 2018,  # Excel変換用
-    }
-    base = era_offset.get(era)
+    base = ERA_OFFSET.get(era)
     if base is None:
         return None
     return datetime(base + year, month, day)
 
-@st.cache_data(ttl=86400)  # 1日キャッシュ
-def load_mof_raw_data():
-    url_all = "https://www.mof.go.jp/jgbs/reference/interest_rate/data/jgbcm_all.csv"
-    url_current = "https://www.mof.go.jp/jgbs/reference/interest_rate/jgbcm.csv"
+def convert_wareki_series(values):
+    # convert_wareki_to_datetime の列版。文字列演算でまとめて変換し、変換できない値は NaT にする
+    parts = pd.Series(values, dtype=object).str.extract(r"^([MTSHRE])(\d+)\.(\d+)\.(\d+)")
+    year = parts[0].map(ERA_OFFSET) + pd.to_numeric(parts[1])
+    return pd.to_datetime(
+        pd.DataFrame({"year": year, "month": pd.to_numeric(parts[2]), "day": pd.to_numeric(parts[3])}).astype("float64"),
+        errors="coerce",
+    )
 
-    df_all = pd.read_csv(url_all, encoding="shift_jis", header=1)
-    df_current = pd.read_csv(url_current, encoding="shift_jis", header=1)
+def _read_mof_csv(url):
+    df = pd.read_csv(url, encoding="shift_jis", header=1)
+    metrics.inc("upstream_bytes_total", int(df.memory_usage(deep=True).sum()), source="mof")
+    df["date"] = convert_wareki_series(df["基準日"])
+    return df
 
-    df_all["date"] = df_all["基準日"].apply(convert_wareki_to_datetime)
-    df_current["date"] = df_current["基準日"].apply(convert_wareki_to_datetime)
+def build_yield_curve(*frames):
+    # 財務省 CSV（複数可）から 日付 × 年限 の float 利回り行列を組み立てる。後のファイルの値を優先
+    df = pd.concat(frames, ignore_index=True)
+    df = df.dropna(subset=["date"]).sort_values("date", kind="stable").drop_duplicates("date", keep="last")
+    terms = [col for col in df.columns if col not in ("基準日", "date")]
+    curve = df.set_index("date")[terms].replace("-", pd.NA).apply(pd.to_numeric, errors="coerce")
+    return curve.astype("float64").dropna(how="all")
 
-    return df_all, df_current
+@shared_cache(ttl=MOF_MAX_AGE, codec=FrameCodec)  # 1日キャッシュ（プロセス間で共有）
+def load_mof_full_curve():
+    # 全期間ファイルと当月分ファイルから利回り行列を作る。文字列の列を含む元の CSV は保持しない
+    return build_yield_curve(_read_mof_csv(MOF_URL_ALL), _read_mof_csv(MOF_URL_CURRENT))
 
-@st.cache_data(ttl=86400)  # 1日キャッシュ
-def fetch_japan_bond_yield_mof(start_date, end_date, term="10年"):
-    try:
-        df_all, df_current = load_mof_raw_data()
+def _save_mof_curve(curve, end_date):
+    for term in curve.columns:
+        values = curve[term].dropna()
+        if not values.empty:
+            store.save_series(_mof_key(term), values, values.index.min(), end_date)
 
-        common_cols = [col for col in df_all.columns if col in df_current.columns]
-        df_all = df_all[common_cols]
-        df_current = df_current[common_cols]
+def _update_mof_store(max_age=MOF_MAX_AGE):
+    # 全期間ファイルは初回（または欠損がある場合）のみ取得し、以降は当月分ファイルで末尾を追記する
+    coverage = store.get_coverage(_mof_key("10年"))
+    if coverage is not None and time.time() - coverage.updated_at <= max_age:
+        return
 
-        df = pd.concat([df_all, df_current], ignore_index=True)
-        df = df.dropna(subset=["date"])
-        df = df.sort_values("date").drop_duplicates("date")
+    tomorrow = pd.Timestamp.today().normalize() + timedelta(days=1)
+    df_current = _read_mof_csv(MOF_URL_CURRENT)
+    first_current = df_current["date"].min()
 
-        if term not in df.columns:
-            return pd.DataFrame()
+    # 当月分ファイルの先頭と保存済みの最終日の間に（週末・祝日を超える）空きがあれば全期間を取り直す
+    if coverage is None or coverage.last_date is None or pd.isna(first_current) \
+            or first_current - coverage.last_date > timedelta(days=5):
+        _save_mof_curve(load_mof_full_curve(), tomorrow)
+    else:
+        _save_mof_curve(build_yield_curve(df_current), tomorrow)
 
-        df = df[["date", term]].dropna()
-        df[term] = pd.to_numeric(df[term].replace("-", pd.NA), errors="coerce")
-        df = df.dropna()
-        df = df.set_index("date").astype(float)
-        df.columns = [f"JPY{term}"]
+def _refresh_mof_yield_curve(max_age=MOF_MAX_AGE):
+    stale = False
+    try:
+        with shared_lock("mof"):
+            call_with_retry("mof", _update_mof_store, max_age, retries=2)
+    except Exception as e:
+        # 更新に失敗しても保存済みのデータがあれば、印を付けて短い期間だけ返す
+        logger.error("MOFデータ取得エラー: %s", e)
+        stale = True
 
-        return df.loc[start_date:end_date].sort_index()
+    # 年限ごとの利回りを全期間分キャッシュに載せる（利回り行列そのものは保持しない）
+    curve = store.load_frame(prefix="mof:")
+    end = pd.Timestamp.today().normalize() + timedelta(days=2)
+    for key in curve.columns:
+        series = CompactSeries.from_series(curve[key], stale=stale).dropna()
+        series_cache.put(key, series, MOF_HISTORY_START, end, STALE_TTL if stale else MOF_MAX_AGE)
+    return [key[len("mof:"):] for key in curve.columns]
+
+def refresh_mof_yield_curve(max_age):
+    # 年限ごとの利回りを期限切れ前に載せ直す（ストアの更新から max_age 秒以上経っていれば MOF から取り直す）
+    return single_flight.do("mof", _refresh_mof_yield_curve, max_age)
+
+@instrumented("fetch_japan_bond_yield_mof", key=lambda start_date, end_date, term="10年": term)
+def fetch_japan_bond_yield_mof(start_date, end_date, term="10年"):
+    try:
+        end_exclusive = pd.Timestamp(end_date) + timedelta(days=1)
+        series = series_cache.get(_mof_key(term), start_date, end_exclusive)
+        if series is None:
+            # 全年限を 1 度にまとめて載せ直す
+            if term not in single_flight.do("mof", _refresh_mof_yield_curve):
+                return pd.DataFrame()
+            series = series_cache.get(_mof_key(term), start_date, end_exclusive)
+        if series is None:
+            return pd.DataFrame()
+        return series.to_frame(f"JPY{term}")
 
     except Exception as e:
-        st.error(f"MOFデータ取得エラー: {e}")
-        return pd.DataFrame()
\ No newline at end of file
+        logger.error("MOFデータ取得エラー: %s", e)
+        return pd.DataFrame()
@@ -0,0 +1,346 @@
+import functools
+import inspect
+import os
+import threading
+import time
+
+# 取得処理の計測（プロセス内）。呼び出しごとの所要時間・キャッシュのヒット/ミス・再試行回数・行数・バイト数を集計し、
+# Prometheus のテキスト形式でも出力する
+METRICS_ENABLED = os.environ.get("METRICS", "1") != "0"
+METRICS_MAX_KEYS = int(os.environ.get("METRICS_MAX_KEYS", 200))  # ティッカーなど key ラベルの種類の上限（超えた分は "other"）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_HELP = {
+    "fetch_calls_total": "取得関数の呼び出し回数（cache: hit / miss / partial / negative / none）",
+    "fetch_duration_seconds": "取得関数の所要時間",
+    "fetch_key_duration_seconds": "ティッカー・年限ごとの取得関数の所要時間",
+    "fetch_retries_total": "取得関数の中で発生した再試行の回数",
+    "fetch_stale_total": "最新データを取得できず保存済みのデータを返した回数",
+    "fetch_rows_total": "取得関数が返した行数",
+    "fetch_bytes_total": "取得関数が返したデータのバイト数",
+    "upstream_requests_total": "取得元へのリクエスト回数（outcome: ok / error / rejected）",
+    "upstream_duration_seconds": "取得元へのリクエスト 1 回の所要時間",
+    "upstream_retries_total": "取得元への再試行の回数",
+    "upstream_bytes_total": "取得元から受け取ったデータのバイト数",
+    "analysis_prompt_tokens": "分析プロンプトのトークン数",
+    "analysis_prompt_trimmed_tokens_total": "重複除去・トークン予算での切り詰めで減らしたトークン数",
+    "analysis_news_items_total": "分析プロンプトのニュースの件数（stage: total / unique / used）",
+}
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "count", "sum", "max")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q):
+        # バケットの上限で近似した分位点（最後のバケットを超える場合は最大値）
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class MetricsRegistry:
+    def __init__(self, max_keys=METRICS_MAX_KEYS):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._keys = set()
+        self._collectors = []
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            key = (name, _label_key(labels))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        with self._lock:
+            key = (name, _label_key(labels))
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def key_label(self, key):
+        # key ラベルの種類が増え続けないよう、上限を超えた新しい値は "other" にまとめる
+        key = str(key)
+        with self._lock:
+            if key in self._keys:
+                return key
+            if len(self._keys) >= self.max_keys:
+                return "other"
+            self._keys.add(key)
+            return key
+
+    def register_collector(self, collect):
+        # collect() は (名前, ラベルの dict, 値) のリストを返す。出力のたびに呼ばれる（キャッシュの件数などの現在値）
+        with self._lock:
+            self._collectors.append(collect)
+
+    def counters(self, name):
+        with self._lock:
+            return {labels: value for (n, labels), value in self._counters.items() if n == name}
+
+    def histograms(self, name):
+        with self._lock:
+            return {labels: h for (n, labels), h in self._histograms.items() if n == name}
+
+    def gauges(self):
+        # 登録した collector から集めた現在値（名前, ラベルの dict, 値）
+        gauges = []
+        for collect in list(self._collectors):
+            try:
+                gauges.extend(collect())
+            except Exception:
+                continue
+        return gauges
+
+    def snapshot(self):
+        # JSON にできる形の現在値
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            histograms = [
+                {"name": name, "labels": dict(labels), "count": h.count, "sum": h.sum, "max": h.max,
+                 "p50": h.quantile(0.5), "p95": h.quantile(0.95)}
+                for (name, labels), h in sorted(self._histograms.items())
+            ]
+        gauges = [{"name": name, "labels": labels, "value": value} for name, labels, value in self.gauges()]
+        return {"counters": counters, "histograms": histograms, "gauges": gauges}
+
+    def to_prometheus(self):
+        # Prometheus のテキスト形式（text/plain; version=0.0.4）
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h.counts), h.count, h.sum, h.buckets)) for key, h in self._histograms.items())
+
+        def header(name, kind):
+            if name in _HELP:
+                lines.append(f"# HELP {name} {_HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        previous = None
+        for (name, labels), value in counters:
+            if name != previous:
+                header(name, "counter")
+                previous = name
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        previous = None
+        for (name, labels), (counts, count, total, buckets) in histograms:
+            if name != previous:
+                header(name, "histogram")
+                previous = name
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', _format_value(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        previous = None
+        for name, labels, value in sorted(self.gauges(), key=lambda g: g[0]):
+            if name != previous:
+                header(name, "gauge")
+                previous = name
+            lines.append(f"{name}{_format_labels(_label_key(labels))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._keys.clear()
+
+
+metrics = MetricsRegistry()
+
+
+class CallRecord:
+    # 計測中の 1 回の呼び出し。キャッシュの結果・再試行は内側の処理が note_cache / note_retry で書き込む
+    __slots__ = ("op", "key", "cache", "retries")
+
+    def __init__(self, op, key=None):
+        self.op = op
+        self.key = key
+        self.cache = None  # hit / miss / partial / negative（参照しなかった場合は None）
+        self.retries = 0
+
+
+_local = threading.local()
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def current_call():
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+def note_cache(hit):
+    # 計測中の呼び出しの最初のキャッシュ参照だけを記録する（ミスした後の計算の中で参照した別のキャッシュは数えない）
+    call = current_call()
+    if call is not None and call.cache is None:
+        call.cache = "hit" if hit else "miss"
+
+
+def note_cache_result(result):
+    # キャッシュの結果を直接指定する（一部だけヒットした一括取得の partial、ネガティブキャッシュの negative など）
+    call = current_call()
+    if call is not None:
+        call.cache = result
+
+
+def note_upstream(source, started, outcome, nbytes=0):
+    # 取得元へのリクエスト 1 回分（started は time.perf_counter() の値）
+    metrics.inc("upstream_requests_total", source=source, outcome=outcome)
+    metrics.observe("upstream_duration_seconds", time.perf_counter() - started, source=source)
+    if nbytes:
+        metrics.inc("upstream_bytes_total", nbytes, source=source)
+
+
+def note_retry(source):
+    metrics.inc("upstream_retries_total", source=source)
+    call = current_call()
+    if call is not None:
+        call.retries += 1
+
+
+def payload_size(value):
+    # 戻り値の (行数, バイト数)。DataFrame・その dict・文字列のリストに対応する
+    if value is None:
+        return 0, 0
+    if hasattr(value, "memory_usage") and hasattr(value, "index"):
+        return len(value), int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, dict):
+        sizes = [payload_size(v) for v in value.values()]
+        return sum(s[0] for s in sizes), sum(s[1] for s in sizes)
+    if isinstance(value, str):
+        return 1, len(value.encode("utf-8"))
+    if isinstance(value, (list, tuple)):
+        return len(value), sum(len(str(v).encode("utf-8")) for v in value)
+    return 0, 0
+
+
+def _finish(call, started, error, result):
+    elapsed = time.perf_counter() - started
+    cache = call.cache or "none"
+    metrics.inc("fetch_calls_total", op=call.op, cache=cache, outcome="error" if error else "ok")
+    metrics.observe("fetch_duration_seconds", elapsed, op=call.op, cache=cache)
+    if call.key is not None:
+        metrics.observe("fetch_key_duration_seconds", elapsed, op=call.op, key=metrics.key_label(call.key))
+    if call.retries:
+        metrics.inc("fetch_retries_total", call.retries, op=call.op)
+    frames = result.values() if isinstance(result, dict) else [result]
+    if any(getattr(frame, "attrs", {}).get("stale") for frame in frames):
+        metrics.inc("fetch_stale_total", op=call.op)
+    if not error:
+        rows, nbytes = payload_size(result)
+        metrics.inc("fetch_rows_total", rows, op=call.op)
+        metrics.inc("fetch_bytes_total", nbytes, op=call.op)
+
+
+def instrumented(op, key=None):
+    # 関数を op として計測するデコレータ。key は引数から計測用のキー（ティッカー・年限など）を取り出す関数。
+    # ジェネレーター関数は最後まで読み終えるまでを 1 回の呼び出しとして計測する
+    def decorator(fn):
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def gen_wrapper(*args, **kwargs):
+                if not METRICS_ENABLED:
+                    yield from fn(*args, **kwargs)
+                    return
+                call = CallRecord(op, key(*args, **kwargs) if key else None)
+                started = time.perf_counter()
+                error = None
+                parts = []
+                inner = fn(*args, **kwargs)
+                try:
+                    while True:
+                        # 呼び出し側に値を返している間は計測中の呼び出しから外す
+                        _stack().append(call)
+                        try:
+                            part = next(inner)
+                        except StopIteration:
+                            break
+                        finally:
+                            _stack().pop()
+                        parts.append(part)
+                        yield part
+                except GeneratorExit:
+                    # 呼び出し側が途中で読むのをやめた場合はエラーとしない
+                    raise
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    inner.close()
+                    _finish(call, started, error, "".join(str(p) for p in parts))
+            return gen_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not METRICS_ENABLED:
+                return fn(*args, **kwargs)
+            call = CallRecord(op, key(*args, **kwargs) if key else None)
+            stack = _stack()
+            stack.append(call)
+            started = time.perf_counter()
+            error = None
+            result = None
+            try:
+                result = fn(*args, **kwargs)
+                return result
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                stack.pop()
+                _finish(call, started, error, result)
+        return wrapper
+    return decorator
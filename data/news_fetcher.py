@@ -1,10 +1,26 @@
 import os
-import requests
+import logging
 from datetime import datetime, timedelta
-import streamlit as st  # 追加：キャッシュ用
+from data import news_store
+from data.metrics import instrumented, metrics
+from data.resilience import call_with_retry
+from data.shared_cache import shared_cache, shared_lock
+from data.singleflight import single_flight
+
+logger = logging.getLogger(__name__)
 
-API_KEY = os.environ["MARKETAUX_API_KEY"]
 BASE_URL = "https://api.marketaux.com/v1/news/all"
+NEWS_MAX_AGE = 1800  # 30分キャッシュ（直近の日の記事を取り直す間隔）
+NEWS_LIMIT = 50  # 返す記事数
+NEWS_ERROR_PREFIX = "[ニュース取得エラー]"
+NEWS_PAGE_SIZE = 50
+NEWS_MAX_PAGES = 3  # 1 日・1 キーワードグループあたりにたどるページ数の上限
+NEWS_SHARDS = 3  # キーワードを分けて検索するグループ数
+NEWS_FETCH_BUDGET = int(os.environ.get("NEWS_FETCH_BUDGET", 30))  # 1 回の呼び出しで直近の日に送るリクエスト数の上限
+# 過去の日（長いプリセットの埋め戻し）は 1 キーワードグループあたり 1 ページとし、1 回の呼び出しと 1 日あたりの累計にも上限を設ける
+NEWS_BACKFILL_PAGES = 1
+NEWS_BACKFILL_BUDGET = int(os.environ.get("NEWS_BACKFILL_BUDGET", 3))
+NEWS_DAY_BUDGET = int(os.environ.get("NEWS_DAY_BUDGET", 6))
 
 # 世界経済に影響を与える英語キーワード一覧
 KEYWORDS_EN = [
@@ -13,43 +29,122 @@ KEYWORDS_EN = [
     "oil prices", "commodity prices", "supply chain", "China economy", "US economy",
     "geopolitical risk", "trade war", "bond yields", "stock market"
 ]
+KEYWORD_SHARDS = [KEYWORDS_EN[i::NEWS_SHARDS] for i in range(NEWS_SHARDS)]
+# 保存済み記事の全文検索用（いずれかのキーワードを含む記事）
+MATCH_QUERY = " OR ".join(f'"{keyword}"' for keyword in KEYWORDS_EN)
 
-@st.cache_data(ttl=1800)  # 30分キャッシュ
-def fetch_market_news(start_date=None, end_date=None):
-    # デフォルト期間：過去1日
-    if start_date is None:
-        start_date = datetime.utcnow() - timedelta(days=1)
-    if end_date is None:
-        end_date = datetime.utcnow()
+def _api_key():
+    # API キーは取得する時に確認する（保存済みの記事だけで足りる場合は不要）
+    api_key = os.environ.get("MARKETAUX_API_KEY")
+    if not api_key:
+        raise RuntimeError("MARKETAUX_API_KEY が設定されていません。")
+    return api_key
 
-    start_iso = start_date.replace(hour=0, minute=0, second=0, microsecond=0).strftime("%Y-%m-%dT%H:%M:%S")
-    end_iso = end_date.replace(hour=0, minute=0, second=0, microsecond=0).strftime("%Y-%m-%dT%H:%M:%S")
+def _get_json(params):
+    import requests  # 初めて取得する時に読み込む
+    response = requests.get(BASE_URL, params=params)
+    metrics.inc("upstream_bytes_total", len(response.content), source="marketaux")
+    response.raise_for_status()
+    return response.json()
 
-    keyword_query = "|".join(KEYWORDS_EN)
+def _fetch_page(day, keywords, page, since=None):
+    # since を指定した場合は、その日のうちその日時より後に公開された記事だけを取得する
+    day_start = datetime.strptime(day, "%Y-%m-%d")
     params = {
-        "api_token": API_KEY,
-        "search": keyword_query,
+        "api_token": _api_key(),
+        "search": "|".join(keywords),
         "countries": "us,cn,jp,eu,de,gb",
         "language": "en",
-        "limit": 50,
-        "published_after": start_iso,
-        "published_before": end_iso,
+        "limit": NEWS_PAGE_SIZE,
+        "page": page,
+        "published_after": since[:19] if since else day_start.strftime("%Y-%m-%dT%H:%M:%S"),
+        "published_before": (day_start + timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%S"),
         "sort_by": "relevance_score",
     }
+    return call_with_retry("marketaux", _get_json, params, retries=2)
+
+def _fetch_day(day, budget):
+    # 1 日分をキーワードのグループごとにページをたどって取得し、保存する。使ったリクエスト数を返す。
+    # 取得を終えた直近の日は、保存済みの最新の記事より後に公開された分だけを取得する。
+    # 過去の日は関連度の高い 1 ページ分だけを取得し、使ったリクエスト数をその日の累計に記録する
+    recent = news_store.is_recent(day)
+    since = news_store.last_published(day) if recent else None
+    max_pages = NEWS_MAX_PAGES if recent else NEWS_BACKFILL_PAGES
+    articles = {}
+    used = 0
+    complete = True
+    for keywords in KEYWORD_SHARDS:
+        for page in range(1, max_pages + 1):
+            if used >= budget:
+                complete = False
+                break
+            data = _fetch_page(day, keywords, page, since)
+            used += 1
+            items = data.get("data", [])
+            for article in items:
+                articles[article.get("uuid")] = article
+            found = data.get("meta", {}).get("found", 0)
+            if len(items) < NEWS_PAGE_SIZE or page * NEWS_PAGE_SIZE >= found:
+                break
+        else:
+            # 前回からの新しい記事をページの上限までにたどり切れなかった場合は、次回その日全体を取り直す
+            if since:
+                complete = False
+    # 予算が尽きて途中までしか取得できなかった日は、次回の呼び出しで取り直す
+    news_store.save_day(day, articles.values(), complete=complete, requests=0 if recent else used)
+    return used
+
+def _fetch_day_once(day, budget, max_age):
+    # 他のプロセスが同じ日を取得中なら終わるのを待ち、まだ取得が必要な場合だけ取得する
+    with shared_lock(f"news:{day}"):
+        if not news_store.missing_days([day], max_age, max_requests=NEWS_DAY_BUDGET):
+            return 0
+        return _fetch_day(day, budget)
 
+def _update_news_store(start_date, end_date, max_age=NEWS_MAX_AGE):
+    # 期間内で未取得の日だけを、新しい日から予算の範囲で取得する。直近の日と過去の日で予算を分ける
+    days = news_store.missing_days(news_store.days_between(start_date, end_date), max_age, max_requests=NEWS_DAY_BUDGET)
+    if days:
+        _api_key()
+    budgets = {"recent": NEWS_FETCH_BUDGET, "backfill": NEWS_BACKFILL_BUDGET}
+    for day in sorted(days, reverse=True):
+        kind = "recent" if news_store.is_recent(day) else "backfill"
+        if budgets[kind] <= 0:
+            continue
+        # 同じ日の取得が複数セッションから同時に呼ばれた場合は 1 回にまとめる
+        budgets[kind] -= single_flight.do(("news", day), _fetch_day_once, day, budgets[kind], max_age)
+
+def _is_news(items):
+    # 取得エラーの表示は共有キャッシュに保存せず、次の呼び出しで取り直す
+    return not any(item.startswith(NEWS_ERROR_PREFIX) for item in items)
+
+@instrumented("fetch_market_news")
+@shared_cache(ttl=NEWS_MAX_AGE, cache_if=_is_news)
+def fetch_market_news(start_date=None, end_date=None):
+    # デフォルト期間：過去1日
+    if start_date is None:
+        start_date = datetime.utcnow() - timedelta(days=1)
+    if end_date is None:
+        end_date = datetime.utcnow()
+
+    error = None
     try:
-        response = requests.get(BASE_URL, params=params)
-        response.raise_for_status()
-        data = response.json()
-
-        if "data" not in data:
-            return []
-
-        articles = data["data"]
-        summaries = [
-            f"{a['title']} ({a['published_at'][:10]})\n{a['description']}"
-            for a in articles if a.get("title") and a.get("description")
-        ]
-        return summaries
+        _update_news_store(start_date, end_date)
     except Exception as e:
-        return [f"[ニュース取得エラー]: {e}"]
+        # 取得できなくても保存済みの記事があればそれを返す
+        logger.warning("ニュースの取得に失敗しました: %s", e)
+        error = e
+
+    try:
+        rows = news_store.search(news_store.to_day(start_date), news_store.to_day(end_date), MATCH_QUERY, NEWS_LIMIT)
+    except Exception as e:
+        return [f"{NEWS_ERROR_PREFIX}: {e}"]
+    if not rows and error is not None:
+        return [f"{NEWS_ERROR_PREFIX}: {error}"]
+
+    return [f"{title} ({published_at[:10]})\n{description}" for title, description, published_at in rows]
+
+def refresh_market_news(start_date, end_date, max_age):
+    # キャッシュの期限切れを待たずに、直近の日で取得から max_age 秒以上経った分を取り直してキャッシュに載せ直す
+    _update_news_store(start_date, end_date, max_age)
+    return fetch_market_news.refresh(start_date, end_date)
@@ -0,0 +1,173 @@
+import os
+import time
+from datetime import datetime, timedelta
+from data.metrics import metrics
+from data.sqlite_db import connect
+
+# ニュース記事の永続ストア（SQLite）。UTC の日ごとに取得済みかを記録し、見出し・要約を全文検索（FTS5）で引く
+NEWS_STORE_PATH = os.environ.get(
+    "NEWS_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "news.sqlite"),
+)
+RECENT_DAYS = 2  # 取得後も記事が増えうる直近の日数（今日・昨日）
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS articles (
+        id INTEGER PRIMARY KEY,
+        uuid TEXT NOT NULL UNIQUE,
+        day TEXT NOT NULL,
+        published_at TEXT NOT NULL,
+        title TEXT NOT NULL,
+        description TEXT NOT NULL,
+        relevance REAL
+    );
+    CREATE INDEX IF NOT EXISTS articles_day ON articles (day);
+    CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+        title, description, content='articles', content_rowid='id'
+    );
+    CREATE TRIGGER IF NOT EXISTS articles_ai AFTER INSERT ON articles BEGIN
+        INSERT INTO articles_fts (rowid, title, description) VALUES (new.id, new.title, new.description);
+    END;
+    CREATE TABLE IF NOT EXISTS news_days (
+        day TEXT PRIMARY KEY,
+        updated_at REAL NOT NULL,
+        complete INTEGER NOT NULL,
+        requests INTEGER NOT NULL DEFAULT 0
+    );
+"""
+# requests: 直近の日を過ぎてから（過去分の取得で）その日に使ったリクエスト数の累計
+_MIGRATIONS = ["ALTER TABLE news_days ADD COLUMN requests INTEGER NOT NULL DEFAULT 0"]
+
+
+def _connect():
+    return connect(NEWS_STORE_PATH, _SCHEMA, _MIGRATIONS)
+
+
+def to_day(value):
+    return value.strftime("%Y-%m-%d")
+
+
+def days_between(start_date, end_date):
+    # [start_date, end_date) に含まれる日（"YYYY-MM-DD"）
+    day = datetime.combine(start_date.date(), datetime.min.time())
+    end = datetime.combine(end_date.date(), datetime.min.time())
+    days = []
+    while day < end:
+        days.append(to_day(day))
+        day += timedelta(days=1)
+    return days
+
+
+def is_recent(day, today=None):
+    if today is None:
+        today = datetime.utcnow()
+    return day >= to_day(today - timedelta(days=RECENT_DAYS - 1))
+
+
+def missing_days(days, max_age, today=None, max_requests=None):
+    # 未取得（または途中までしか取得していない）日と、直近の日で取得から max_age 秒以上経った日を返す。
+    # max_requests を指定した場合、過去の日で既にその数のリクエストを使った日は途中まででも取得済みとみなす
+    if not days:
+        return []
+
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT day, updated_at, complete, requests FROM news_days WHERE day >= ? AND day <= ?",
+            (min(days), max(days)),
+        ).fetchall()
+    finally:
+        conn.close()
+
+    fetched = {day: (updated_at, complete, requests) for day, updated_at, complete, requests in rows}
+    now = time.time()
+    missing = []
+    for day in days:
+        state = fetched.get(day)
+        if state is None:
+            missing.append(day)
+        elif is_recent(day, today):
+            if not state[1] or now - state[0] > max_age:
+                missing.append(day)
+        elif not state[1] and (max_requests is None or state[2] < max_requests):
+            missing.append(day)
+    return missing
+
+
+def last_published(day):
+    # 取得を終えた日の最新の記事の公開日時（未取得・途中までの日、記事のない日は None）
+    conn = _connect()
+    try:
+        row = conn.execute("""
+            SELECT MAX(a.published_at) FROM news_days d JOIN articles a ON a.day = d.day
+            WHERE d.day = ? AND d.complete = 1
+        """, (day,)).fetchone()
+    finally:
+        conn.close()
+    return row[0]
+
+
+def save_day(day, articles, complete=True, requests=0):
+    # 1 日分の記事を追加（既にある記事はそのまま）し、その日の取得状況と使ったリクエスト数（累計に足す）を記録する
+    rows = [
+        (a["uuid"], day, a["published_at"], a["title"], a["description"], a.get("relevance_score"))
+        for a in articles
+        if a.get("uuid") and a.get("title") and a.get("description")
+    ]
+    conn = _connect()
+    try:
+        with conn:
+            conn.executemany("""
+                INSERT OR IGNORE INTO articles (uuid, day, published_at, title, description, relevance)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+            conn.execute("""
+                INSERT INTO news_days (day, updated_at, complete, requests) VALUES (?, ?, ?, ?)
+                ON CONFLICT (day) DO UPDATE SET
+                    updated_at = excluded.updated_at,
+                    complete = excluded.complete,
+                    requests = requests + excluded.requests
+            """, (day, time.time(), int(complete), requests))
+    finally:
+        conn.close()
+
+
+def search(start_day, end_day, query, limit):
+    # [start_day, end_day) の記事を全文検索の一致度（bm25）で並べ、各日の上位から順に limit 件選ぶ。
+    # 長い期間でも特定の日に偏らないようにし、一致する記事が足りなければ Marketaux の関連度順で補う
+    conn = _connect()
+    try:
+        rows = conn.execute("""
+            WITH matched AS (
+                SELECT a.id, a.day, a.published_at, a.title, a.description, bm25(articles_fts) AS score
+                FROM articles_fts JOIN articles a ON a.id = articles_fts.rowid
+                WHERE articles_fts MATCH ? AND a.day >= ? AND a.day < ?
+            ), ranked AS (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY day ORDER BY score) AS day_rank FROM matched
+            )
+            SELECT id, title, description, published_at FROM ranked ORDER BY day_rank, score LIMIT ?
+        """, (query, start_day, end_day, limit)).fetchall()
+
+        if len(rows) < limit:
+            matched_ids = [row[0] for row in rows]
+            rows += conn.execute(f"""
+                SELECT id, title, description, published_at FROM articles
+                WHERE day >= ? AND day < ? AND id NOT IN ({",".join("?" * len(matched_ids))})
+                ORDER BY relevance DESC, published_at DESC LIMIT ?
+            """, (start_day, end_day, *matched_ids, limit - len(rows))).fetchall()
+    finally:
+        conn.close()
+    return [(title, description, published_at) for _, title, description, published_at in rows]
+
+
+def stats():
+    conn = _connect()
+    try:
+        articles = conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+        days = conn.execute("SELECT COUNT(*) FROM news_days WHERE complete = 1").fetchone()[0]
+    finally:
+        conn.close()
+    return {"articles": articles, "days": days}
+
+
+metrics.register_collector(lambda: [(f"news_store_{name}", {}, value) for name, value in stats().items()])
@@ -0,0 +1,100 @@
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+# 系列ごとに日足・週足・月足の OHLC を事前集計して保持し、表示範囲に合う粒度を切り出す
+LEVELS = OrderedDict({
+    "daily": None,
+    "weekly": "W-FRI",
+    "monthly": "M",
+})
+LEVEL_LABELS = {"daily": "日足", "weekly": "週足", "monthly": "月足"}
+
+_COLUMNS = ["open", "high", "low", "close"]
+
+
+def _aggregate(series, period):
+    # 期間ごとの OHLC。日付は各期間の最終データ日にする
+    keys = series.index.to_period(period)
+    groups = series.groupby(keys)
+    frame = pd.DataFrame({
+        "open": groups.first(),
+        "high": groups.max(),
+        "low": groups.min(),
+        "close": groups.last(),
+        "date": pd.Series(series.index, index=series.index).groupby(keys).last(),
+    })
+    return frame
+
+
+class SeriesPyramid:
+    def __init__(self):
+        self._daily = pd.Series(dtype="float64", index=pd.DatetimeIndex([], name="date"))
+        self._levels = {}
+        self._lock = threading.Lock()
+
+    def update(self, series):
+        # 新しいデータが届いたら、影響する末尾の期間だけを集計し直す
+        series = series.dropna().sort_index().astype("float64")
+        if series.empty:
+            return
+
+        with self._lock:
+            daily = self._daily
+            if daily.empty or series.index[0] < daily.index[0]:
+                # 先頭側に広がった場合は作り直す
+                merged = pd.concat([series, daily[daily.index > series.index[-1]]])
+                self._daily = merged
+                self._levels = {name: _aggregate(merged, period) for name, period in LEVELS.items() if period}
+                return
+
+            # 受け取った範囲で保存済みの値と違う最初の日（過去分の改訂・新しい日）から後ろを差し替える
+            stored = daily.reindex(series.index)
+            changed = series.index[(stored != series).to_numpy()]
+            if changed.empty:
+                return
+
+            start = changed[0]
+            self._daily = pd.concat([
+                daily[daily.index < start],
+                series[series.index >= start],
+                daily[daily.index > series.index[-1]],
+            ])
+            for name, period in LEVELS.items():
+                if not period:
+                    continue
+                cutoff = pd.DatetimeIndex([start]).to_period(period)[0]
+                tail = self._daily[self._daily.index.to_period(period) >= cutoff]
+                frame = self._levels[name]
+                self._levels[name] = pd.concat([frame[frame.index < cutoff], _aggregate(tail, period)])
+
+    def frame(self, level, start_date, end_date):
+        # [start_date, end_date) の OHLC を日付インデックスで返す
+        with self._lock:
+            if level == "daily" or level not in self._levels:
+                daily = self._daily
+                frame = pd.DataFrame({column: daily for column in _COLUMNS})
+            else:
+                frame = self._levels[level].set_index("date")[_COLUMNS]
+        frame.index.name = "date"
+        return frame[(frame.index >= pd.Timestamp(start_date)) & (frame.index < pd.Timestamp(end_date))]
+
+    def select(self, start_date, end_date, max_points):
+        # 表示範囲の点数が max_points 以下に収まる最も細かい粒度を選ぶ
+        frame = None
+        for level in LEVELS:
+            frame = self.frame(level, start_date, end_date)
+            if len(frame) <= max_points:
+                return level, frame
+        return level, frame
+
+
+_pyramids = {}
+_pyramids_lock = threading.Lock()
+
+
+def get_pyramid(key):
+    with _pyramids_lock:
+        if key not in _pyramids:
+            _pyramids[key] = SeriesPyramid()
+        return _pyramids[key]
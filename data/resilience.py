@@ -0,0 +1,142 @@
+import os
+import random
+import threading
+import time
+from data.metrics import metrics, note_retry, note_upstream
+
+# 取得元ごとのサーキットブレーカーと、ジッター付き指数バックオフでの再試行
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", 5))  # 連続失敗がこの回数に達したら遮断
+BREAKER_RESET_TIMEOUT = int(os.environ.get("BREAKER_RESET_TIMEOUT", 60))  # 遮断してから試しに 1 回通すまでの秒数
+MAX_BACKOFF = 30.0  # 再試行の待ち時間の上限（秒）
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self.rejected = 0
+
+    def allow(self):
+        # 遮断中は reset_timeout 経過後に 1 回だけ試しに通し（半開）、結果で復旧するか遮断を続けるかを決める
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._trial and time.time() - self._opened_at >= self.reset_timeout:
+                self._trial = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                self._opened_at = time.time()
+            self._trial = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if self._trial else "open"
+
+    def stats(self):
+        return {"state": self.state, "failures": self._failures, "rejected": self.rejected}
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(source):
+    with _breakers_lock:
+        if source not in _breakers:
+            _breakers[source] = CircuitBreaker(source)
+        return _breakers[source]
+
+
+def _breaker_gauges():
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    states = {"closed": 0, "half-open": 1, "open": 2}
+    gauges = []
+    for breaker in breakers:
+        stats = breaker.stats()
+        gauges.append(("circuit_breaker_state", {"source": breaker.name}, states[stats["state"]]))
+        gauges.append(("circuit_breaker_rejected", {"source": breaker.name}, stats["rejected"]))
+    return gauges
+
+
+metrics.register_collector(_breaker_gauges)
+
+
+def backoff_delay(attempt, base_delay, max_delay=MAX_BACKOFF):
+    # full jitter: 0 〜 base_delay * 2^attempt（上限 max_delay）から一様に選ぶ
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def call_with_retry(source, fn, *args, retries=3, base_delay=2, max_delay=MAX_BACKOFF, **kwargs):
+    # 取得元のブレーカーが遮断中ならすぐに CircuitOpenError を送出し、待たずに失敗させる
+    breaker = get_breaker(source)
+    for attempt in range(retries):
+        if not breaker.allow():
+            metrics.inc("upstream_requests_total", source=source, outcome="rejected")
+            raise CircuitOpenError(f"{source} への接続に連続して失敗しているため、取得を一時停止しています。")
+        if attempt:
+            note_retry(source)
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            note_upstream(source, started, "error")
+            breaker.record_failure()
+            if attempt == retries - 1:
+                raise
+            time.sleep(backoff_delay(attempt, base_delay, max_delay))
+        else:
+            note_upstream(source, started, "ok")
+            breaker.record_success()
+            return result
+
+
+class NegativeCache:
+    # データが返らなかったキー（上場廃止・誤入力のティッカーなど）を短時間覚えておき、その間は取得を試みない
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def add(self, key, reason):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, reason)
+
+    def get(self, key):
+        # 有効な記録があれば理由を、なければ None を返す
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[key]
+                return None
+            return entry[1]
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
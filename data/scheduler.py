@@ -0,0 +1,64 @@
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# 取得元ごとの同時実行数の上限
+SOURCE_LIMITS = {
+    "yfinance": 4,
+    "mof": 2,
+    "marketaux": 2,
+}
+
+
+def _script_run_ctx():
+    # Streamlit 上で動いている場合のみ、ワーカースレッドからも st.warning 等を出せるようにコンテキストを引き継ぐ
+    if "streamlit" not in sys.modules:
+        return None
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    return get_script_run_ctx(suppress_warning=True)
+
+
+def _attach_script_run_ctx(ctx):
+    # プールのスレッドは使い回されるため、毎回呼び出し元のコンテキストで上書きする
+    if "streamlit" not in sys.modules:
+        return
+    from streamlit.runtime.scriptrunner import add_script_run_ctx
+    add_script_run_ctx(threading.current_thread(), ctx)
+
+
+class FetchScheduler:
+    # 取得元ごとに上限と同じ数のスレッドを持つプールを使う。待っているタスクはプールのキューに積まれるだけなので、
+    # ある取得元が混んでいても他の取得元のタスクはすぐに実行される
+    def __init__(self, limits):
+        self._limits = dict(limits)
+        self._executors = {}
+        self._lock = threading.Lock()
+
+    def _executor(self, source):
+        with self._lock:
+            if source not in self._executors:
+                self._executors[source] = ThreadPoolExecutor(
+                    max_workers=self._limits.get(source, 1), thread_name_prefix=f"fetch-{source}",
+                )
+            return self._executors[source]
+
+    def submit(self, source, fn, *args, **kwargs):
+        ctx = _script_run_ctx()
+
+        def run():
+            _attach_script_run_ctx(ctx)
+            return fn(*args, **kwargs)
+
+        return self._executor(source).submit(run)
+
+    def as_completed(self, tasks):
+        # tasks: {名前: (取得元, 関数, 引数...)} をまとめて投入し、完了した順に (名前, Future) を返す
+        futures = {
+            self.submit(source, fn, *args): name
+            for name, (source, fn, *args) in tasks.items()
+        }
+        for future in as_completed(futures):
+            yield futures[future], future
+
+
+scheduler = FetchScheduler(SOURCE_LIMITS)
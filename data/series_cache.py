@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+import numpy as np
+import pandas as pd
+from data.metrics import metrics, note_cache
+from data.store import to_day
+
+# 系列ごとに取得済みの最大範囲を 1 つだけ保持する、全ページ共有のメモリキャッシュ。
+# 系列は 1970-01-01 からの日数（int32）と値の配列で持ち、DataFrame はページに渡す時にだけ作る
+SERIES_CACHE_MAX_BYTES = int(os.environ.get("SERIES_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+SERIES_CACHE_DTYPE = np.dtype(os.environ.get("SERIES_CACHE_DTYPE", "float64"))  # float32 にすると値の配列が半分になる
+ENTRY_OVERHEAD = 256  # 配列以外（エントリ本体・キー）の概算バイト数
+
+_Entry = namedtuple("_Entry", ["start", "end", "series", "nbytes", "expires_at"])
+
+
+def day_number(value):
+    # 日付を 1970-01-01 からの日数にする
+    return int(to_day(value).to_datetime64().astype("datetime64[D]").astype("int64"))
+
+
+class CompactSeries:
+    # 日付順に並んだ日次系列。days は 1970-01-01 からの日数、values は SERIES_CACHE_DTYPE の値
+    __slots__ = ("days", "values", "stale")
+
+    def __init__(self, days, values, stale=False):
+        self.days = days
+        self.values = values
+        self.stale = stale
+
+    @classmethod
+    def from_series(cls, series, stale=False, dtype=None):
+        index = pd.DatetimeIndex(series.index)
+        if index.tz is not None:
+            index = index.tz_localize(None)
+        days = index.values.astype("datetime64[D]").astype("int32")
+        values = series.to_numpy(dtype=dtype or SERIES_CACHE_DTYPE, na_value=np.nan)
+        return cls(days, values, stale)
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def nbytes(self):
+        return self.days.nbytes + self.values.nbytes
+
+    def slice(self, start_date, end_date):
+        # [start_date, end_date) を二分探索で切り出す（配列はコピーせずビューを返す）
+        lo = int(np.searchsorted(self.days, day_number(start_date), side="left"))
+        hi = int(np.searchsorted(self.days, day_number(end_date), side="left"))
+        return CompactSeries(self.days[lo:hi], self.values[lo:hi], self.stale)
+
+    def dropna(self):
+        ok = ~np.isnan(self.values)
+        if ok.all():
+            return self
+        return CompactSeries(self.days[ok], self.values[ok], self.stale)
+
+    def to_frame(self, column):
+        # ページに渡す DataFrame（float64・日付インデックス）を作る。stale は attrs に移す
+        if len(self.days) == 0:
+            return pd.DataFrame()
+        index = pd.DatetimeIndex(self.days.astype("datetime64[D]").astype("datetime64[ns]"), name="date")
+        frame = pd.DataFrame({column: self.values.astype("float64")}, index=index)
+        if self.stale:
+            frame.attrs["stale"] = True
+        return frame
+
+
+class SeriesCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, start_date, end_date):
+        # [start_date, end_date) が保持範囲に含まれていればスライスを返す。なければ None
+        start, end = to_day(start_date), to_day(end_date)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at < time.time() or start < entry.start or end > entry.end:
+                self.misses += 1
+                note_cache(False)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        note_cache(True)
+        return entry.series.slice(start, end)
+
+    def extend_range(self, key, start_date, end_date):
+        # 保持中の範囲と要求範囲を合わせた取得範囲を返す（範囲を置き換えずに広げるため）
+        start, end = to_day(start_date), to_day(end_date)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return start, end
+        return min(start, entry.start), max(end, entry.end)
+
+    def put(self, key, series, start_date, end_date, ttl):
+        # series は CompactSeries。保持するのは配列の分だけで、バイト数の合計で上限を管理する
+        nbytes = series.nbytes + ENTRY_OVERHEAD
+        entry = _Entry(to_day(start_date), to_day(end_date), series, nbytes, time.time() + ttl)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old.nbytes
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self.total_bytes += nbytes
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # 上限を超えた分は、期限切れの系列を先に、次に最も使われていない系列から追い出す
+        now = time.time()
+        for key in [k for k, e in self._entries.items() if e.expires_at < now]:
+            self.total_bytes -= self._entries.pop(key).nbytes
+            self.evictions += 1
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.total_bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "dtype": SERIES_CACHE_DTYPE.name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+series_cache = SeriesCache(SERIES_CACHE_MAX_BYTES)
+metrics.register_collector(lambda: [
+    (f"series_cache_{name}", {}, value)
+    for name, value in series_cache.stats().items()
+    if name != "dtype"
+])
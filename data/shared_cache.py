@@ -0,0 +1,302 @@
+import functools
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+import pandas as pd
+from data.metrics import note_cache
+from data.sqlite_db import connect
+
+# 同じホスト上の複数の Streamlit プロセスで共有するキャッシュとロック。
+# SHARED_CACHE_URL で切り替える: sqlite:///パス（既定）、redis://ホスト:ポート/DB（Redis プロトコル互換のサーバー）、memory://（プロセス内のみ）
+SHARED_CACHE_URL = os.environ.get(
+    "SHARED_CACHE_URL",
+    "sqlite:///" + os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "shared.sqlite"),
+)
+LOCK_TTL = 300  # ロックを持ったプロセスが落ちた場合に自動で解放されるまでの秒数
+LOCK_WAIT = 120  # ロックを待つ最大秒数（超えたらロックなしで続行する）
+LOCK_POLL = 0.1
+
+_KEY_PREFIX = "memo:"
+
+
+class MemoryBackend:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._locks = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None or entry[0] < time.time():
+                return None
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._values[key] = (time.time() + ttl, value)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._values if k.startswith(prefix)]:
+                del self._values[key]
+
+    def try_lock(self, name, owner, ttl):
+        with self._lock:
+            holder = self._locks.get(name)
+            if holder is not None and holder[1] >= time.time():
+                return False
+            self._locks[name] = (owner, time.time() + ttl)
+            return True
+
+    def unlock(self, name, owner):
+        with self._lock:
+            if self._locks.get(name, (None,))[0] == owner:
+                del self._locks[name]
+
+
+class SQLiteBackend:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cache (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            expires_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS locks (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _connect(self):
+        return connect(self.path, self.SCHEMA)
+
+    def get(self, key):
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at >= ?", (key, time.time())
+            ).fetchone()
+        finally:
+            conn.close()
+        return bytes(row[0]) if row else None
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)", (key, value, now + ttl))
+                conn.execute("DELETE FROM cache WHERE expires_at < ?", (now,))
+        finally:
+            conn.close()
+
+    def delete_prefix(self, prefix):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM cache WHERE key >= ? AND key < ?", (prefix, prefix + "\uffff"))
+        finally:
+            conn.close()
+
+    def try_lock(self, name, owner, ttl):
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM locks WHERE name = ? AND expires_at < ?", (name, now))
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO locks (name, owner, expires_at) VALUES (?, ?, ?)", (name, owner, now + ttl)
+                )
+                return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def unlock(self, name, owner):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner))
+        finally:
+            conn.close()
+
+
+class RedisBackend:
+    # Redis プロトコルで話すサーバー（Redis・Valkey・ローカルの代替サーバーなど）を使う。redis パッケージが必要。
+    # client を渡した場合は redis を読み込まずにそれを使う（redis.Redis と同じメソッドを持つ代替クライアント）
+    _UNLOCK_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+    def __init__(self, url=None, client=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self._client = client
+
+    def get(self, key):
+        return self._client.get(key)
+
+    def set(self, key, value, ttl):
+        self._client.set(key, value, ex=max(int(ttl), 1))
+
+    def delete_prefix(self, prefix):
+        for key in self._client.scan_iter(match=prefix + "*"):
+            self._client.delete(key)
+
+    def try_lock(self, name, owner, ttl):
+        return bool(self._client.set(f"lock:{name}", owner, nx=True, px=int(ttl * 1000)))
+
+    def unlock(self, name, owner):
+        self._client.eval(self._UNLOCK_SCRIPT, 1, f"lock:{name}", owner)
+
+
+def _create_backend(url):
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    if url.startswith("memory://"):
+        return MemoryBackend()
+    raise ValueError(f"未対応の SHARED_CACHE_URL です: {url}")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = _create_backend(SHARED_CACHE_URL)
+        return _backend
+
+
+def set_backend(backend):
+    # SHARED_CACHE_URL の代わりに使うバックエンド（テスト・ローカルの代替サーバー用）。None で SHARED_CACHE_URL に戻す
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+@contextmanager
+def shared_lock(name, ttl=LOCK_TTL, wait=LOCK_WAIT):
+    # プロセスをまたいだ排他。取得元への同じリクエストを 1 つのプロセスだけが送るようにする。
+    # バックエンドが使えない・待ちきれない場合はロックなしで続行する（取得が重複するだけで結果は変わらない）
+    owner = uuid.uuid4().hex
+    backend = get_backend()
+    acquired = False
+    deadline = time.time() + wait
+    try:
+        while True:
+            try:
+                acquired = backend.try_lock(name, owner, ttl)
+            except Exception:
+                break
+            if acquired or time.time() >= deadline:
+                break
+            time.sleep(LOCK_POLL)
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                backend.unlock(name, owner)
+            except Exception:
+                pass
+
+
+# 値の直列化（pickle は使わない）
+class JSONCodec:
+    @staticmethod
+    def encode(value):
+        return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+    @staticmethod
+    def decode(data):
+        return json.loads(data.decode("utf-8"))
+
+
+def frame_to_bytes(frame):
+    # Parquet（列指向・圧縮）で直列化する。文字列と欠損が混在する列は文字列型にそろえる
+    frame = frame.copy()
+    for column in frame.columns[frame.dtypes == object]:
+        frame[column] = frame[column].astype("string")
+    buffer = io.BytesIO()
+    frame.to_parquet(buffer)
+    return buffer.getvalue()
+
+
+def frame_from_bytes(data):
+    return pd.read_parquet(io.BytesIO(data))
+
+
+class FrameCodec:
+    # DataFrame 1 つを Parquet のバイト列にする
+    encode = staticmethod(frame_to_bytes)
+    decode = staticmethod(frame_from_bytes)
+
+
+def _memo_key(fn, args, kwargs):
+    raw = repr((args, tuple(sorted(kwargs.items()))))
+    return f"{_KEY_PREFIX}{fn.__module__}.{fn.__qualname__}:{hashlib.md5(raw.encode('utf-8')).hexdigest()}"
+
+
+def shared_cache(ttl, codec=JSONCodec, cache_if=None):
+    # 引数ごとの結果をプロセス間で共有するメモ化デコレータ。
+    # 未保存ならロックを取ってから計算し、同時に呼んだ他のプロセスは計算済みの結果を待って使う。
+    # cache_if を指定した場合、cache_if(結果) が偽の結果（エラー表示など）は保存しない
+    def decorator(fn):
+        prefix = f"{_KEY_PREFIX}{fn.__module__}.{fn.__qualname__}:"
+
+        def load(key):
+            try:
+                data = get_backend().get(key)
+            except Exception:
+                return None
+            return None if data is None else codec.decode(data)
+
+        def compute(key, args, kwargs):
+            value = fn(*args, **kwargs)
+            if cache_if is not None and not cache_if(value):
+                return value
+            try:
+                get_backend().set(key, codec.encode(value), ttl)
+            except Exception:
+                pass
+            return value
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = _memo_key(fn, args, kwargs)
+            value = load(key)
+            note_cache(value is not None)
+            if value is not None:
+                return value
+            with shared_lock(key):
+                value = load(key)
+                if value is not None:
+                    return value
+                return compute(key, args, kwargs)
+
+        def refresh(*args, **kwargs):
+            # 期限を待たずに計算し直して保存する（期限切れ前の事前更新用）
+            key = _memo_key(fn, args, kwargs)
+            with shared_lock(key):
+                return compute(key, args, kwargs)
+
+        def clear():
+            get_backend().delete_prefix(prefix)
+
+        wrapper.clear = clear
+        wrapper.refresh = refresh
+        return wrapper
+
+    return decorator
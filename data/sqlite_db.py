@@ -0,0 +1,29 @@
+import os
+import sqlite3
+import threading
+
+# 永続ストア・キャッシュ共通の SQLite 接続。ファイルごとに初回の接続で WAL を有効にしてテーブルを作る。
+# migrations は既存のファイルに後から足した列などの文で、適用済み（列が既にある）場合のエラーは無視する
+SQLITE_TIMEOUT = 30
+
+_init_lock = threading.Lock()
+_initialized = set()
+
+
+def connect(path, schema, migrations=()):
+    path = os.path.abspath(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=SQLITE_TIMEOUT)
+    if path not in _initialized:
+        with _init_lock:
+            if path not in _initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(schema)
+                for statement in migrations:
+                    try:
+                        conn.execute(statement)
+                    except sqlite3.OperationalError:
+                        pass
+                conn.commit()
+                _initialized.add(path)
+    return conn
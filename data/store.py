@@ -0,0 +1,147 @@
+import os
+import time
+from collections import namedtuple
+from datetime import timedelta
+import pandas as pd
+from data.sqlite_db import connect
+
+# 系列データの永続ストア（SQLite）。系列ごとに全履歴と取得済み期間を保持する
+STORE_PATH = os.environ.get(
+    "SERIES_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "series.sqlite"),
+)
+
+Coverage = namedtuple("Coverage", ["start", "end", "last_date", "updated_at"])
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS series (
+        key TEXT NOT NULL,
+        date TEXT NOT NULL,
+        value REAL NOT NULL,
+        PRIMARY KEY (key, date)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS coverage (
+        key TEXT PRIMARY KEY,
+        start TEXT NOT NULL,
+        end TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    );
+"""
+
+
+def _connect():
+    return connect(STORE_PATH, _SCHEMA)
+
+
+def to_day(value):
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_localize(None)
+    return ts.normalize()
+
+
+def _fmt(value):
+    return to_day(value).strftime("%Y-%m-%d")
+
+
+def get_coverage(key):
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT start, end, updated_at FROM coverage WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        last = conn.execute("SELECT MAX(date) FROM series WHERE key = ?", (key,)).fetchone()[0]
+    finally:
+        conn.close()
+    return Coverage(
+        start=pd.Timestamp(row[0]),
+        end=pd.Timestamp(row[1]),
+        last_date=pd.Timestamp(last) if last else None,
+        updated_at=row[2],
+    )
+
+
+def missing_ranges(key, start_date, end_date, max_age, overlap_days=5):
+    # 取得済み期間に含まれない範囲 [start, end) を返す。末尾は overlap_days 分だけ重ねて再取得する。
+    # 取得済み期間は 1 つの区間なので、離れた範囲を要求された場合も間を埋めて連続したまま広げる
+    start, end = to_day(start_date), to_day(end_date)
+    if start >= end:
+        return []
+
+    coverage = get_coverage(key)
+    if coverage is None:
+        return [(start, end)]
+
+    ranges = []
+    if start < coverage.start:
+        ranges.append((start, coverage.start))
+
+    stale = time.time() - coverage.updated_at > max_age
+    tail_start = coverage.end if coverage.last_date is None else min(coverage.end, coverage.last_date + timedelta(days=1))
+    tail_start = max(tail_start - timedelta(days=overlap_days), coverage.start)
+    if end > coverage.end or (stale and end > tail_start):
+        ranges.append((tail_start, max(end, coverage.end)))
+
+    return ranges
+
+
+def load_series(key, start_date=None, end_date=None):
+    # [start_date, end_date) の範囲を float の Series で返す
+    query = "SELECT date, value FROM series WHERE key = ?"
+    params = [key]
+    if start_date is not None:
+        query += " AND date >= ?"
+        params.append(_fmt(start_date))
+    if end_date is not None:
+        query += " AND date < ?"
+        params.append(_fmt(end_date))
+    query += " ORDER BY date"
+
+    conn = _connect()
+    try:
+        rows = conn.execute(query, params).fetchall()
+    finally:
+        conn.close()
+
+    index = pd.DatetimeIndex(pd.to_datetime([r[0] for r in rows]), name="date")
+    return pd.Series([r[1] for r in rows], index=index, dtype="float64", name=key)
+
+
+def load_frame(prefix):
+    # キーが prefix で始まる全系列を 日付 × キー の横長 DataFrame で返す
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT key, date, value FROM series WHERE key >= ? AND key < ? ORDER BY date",
+            (prefix, prefix + "\uffff"),
+        ).fetchall()
+    finally:
+        conn.close()
+
+    df = pd.DataFrame(rows, columns=["key", "date", "value"])
+    df["date"] = pd.to_datetime(df["date"])
+    frame = df.pivot(index="date", columns="key", values="value").astype("float64")
+    frame.columns.name = None
+    return frame
+
+
+def save_series(key, series, start_date, end_date):
+    # 系列を追記（同日の値は上書き）し、取得済み期間を [start_date, end_date) まで広げる。
+    # updated_at は末尾まで取得し直した場合だけ更新する（過去の期間を埋めただけでは末尾は新しくならない）
+    series = pd.to_numeric(series, errors="coerce").dropna()
+    rows = [(key, _fmt(d), float(v)) for d, v in series.items()]
+    start, end = _fmt(start_date), _fmt(end_date)
+
+    conn = _connect()
+    try:
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO series (key, date, value) VALUES (?, ?, ?)", rows)
+            conn.execute("""
+                INSERT INTO coverage (key, start, end, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    start = MIN(start, excluded.start),
+                    end = MAX(end, excluded.end),
+                    updated_at = CASE WHEN excluded.end >= end THEN excluded.updated_at ELSE updated_at END
+            """, (key, start, end, time.time()))
+    finally:
+        conn.close()
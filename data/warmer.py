@@ -0,0 +1,149 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from functools import partial
+from config.indicators import yfinance_tickers
+from data.fetcher import YF_MAX_AGE, MOF_MAX_AGE, refresh_data_batch, refresh_mof_yield_curve
+from data.news_fetcher import NEWS_MAX_AGE, refresh_market_news
+from data.scheduler import scheduler
+from services.periods import PRESET_OPTIONS, CUSTOM_PRESET, fetch_window, preset_range
+from services.snapshot import MATERIALIZED_MAX_AGE, materialize
+
+# キャッシュの期限が切れる少し前に、全指標と既定プリセットのニュースをバックグラウンドで取り直す（プロセス内）。
+# 指標を取り直した後はダッシュボードが読み込むスナップショットも事前計算し直す
+CACHE_WARMER_ENABLED = os.environ.get("CACHE_WARMER", "1") != "0"
+CACHE_WARM_LEAD = int(os.environ.get("CACHE_WARM_LEAD", 300))  # 期限の何秒前に更新するか
+RETRY_DELAY = 60  # 失敗したジョブを再実行するまでの秒数
+
+logger = logging.getLogger(__name__)
+
+# then: 成功した後にすぐ実行するジョブの名前
+WarmJob = namedtuple("WarmJob", ["name", "source", "interval", "fn", "then"], defaults=[()])
+
+
+def _interval(ttl, lead=CACHE_WARM_LEAD):
+    return max(ttl - lead, RETRY_DELAY)
+
+
+def _warm_yfinance(max_age):
+    # ダッシュボードで最も長いプリセットの取得範囲（変化率用の遡り分を含む）を対象にする
+    presets = [name for name in PRESET_OPTIONS if name != CUSTOM_PRESET]
+    longest = min(presets, key=lambda name: preset_range(name)[0])
+    start_date, end_date = preset_range(longest)
+    fetch_start_date, _, _ = fetch_window(longest, start_date, end_date)
+    failed = refresh_data_batch(yfinance_tickers, fetch_start_date, end_date, max_age=max_age)
+    if failed:
+        logger.warning("事前更新で取得できなかったティッカー: %s", ", ".join(sorted(failed)))
+
+
+def _warm_mof(max_age):
+    refresh_mof_yield_curve(max_age=max_age)
+
+
+def _warm_news(max_age):
+    # ダッシュボードの既定のプリセット（選択肢の先頭）のニュース取得期間
+    range_option = list(PRESET_OPTIONS)[0]
+    start_date, end_date = preset_range(range_option)
+    _, news_start, news_end = fetch_window(range_option, start_date, end_date)
+    refresh_market_news(news_start, news_end, max_age)
+
+
+def _warm_snapshot():
+    # 分析コメント（OpenAI）はバックグラウンドでは生成しない
+    materialize()
+
+
+def default_jobs(lead=CACHE_WARM_LEAD):
+    yf_interval = _interval(YF_MAX_AGE, lead)
+    mof_interval = _interval(MOF_MAX_AGE, lead)
+    news_interval = _interval(NEWS_MAX_AGE, lead)
+    return [
+        WarmJob("yfinance", "yfinance", yf_interval, partial(_warm_yfinance, yf_interval), then=("snapshot",)),
+        WarmJob("mof", "mof", mof_interval, partial(_warm_mof, mof_interval), then=("snapshot",)),
+        WarmJob("news", "marketaux", news_interval, partial(_warm_news, news_interval)),
+        # 取得元の上限を指標の取得と分け合わないよう、専用の取得元（同時実行 1）で動かす
+        WarmJob("snapshot", "snapshot", _interval(MATERIALIZED_MAX_AGE, lead), _warm_snapshot),
+    ]
+
+
+class CacheWarmer:
+    def __init__(self, jobs, retry_delay=RETRY_DELAY):
+        self._jobs = list(jobs)
+        self.retry_delay = retry_delay
+        self._queue = []  # (実行予定時刻, 番号, ジョブ)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._rerun = set()  # 実行中に then で呼ばれ、終わった後にもう一度実行するジョブ
+        self.last_runs = {}
+
+    def start(self):
+        # 起動直後に全ジョブを 1 回実行し、以降は各ジョブの間隔で繰り返す。2 回目以降の呼び出しは何もしない。
+        # 他のジョブの then で呼ばれるジョブは、起動直後は実行せずそのジョブの成功を待つ
+        with self._cond:
+            if self._thread is not None:
+                return
+            now = time.time()
+            followups = {name for job in self._jobs for name in job.then}
+            for seq, job in enumerate(self._jobs):
+                heapq.heappush(self._queue, (now + job.interval if job.name in followups else now, seq, job))
+            self._thread = threading.Thread(target=self._run, name="cache-warmer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue or self._queue[0][0] > time.time():
+                    self._cond.wait(self._queue[0][0] - time.time() if self._queue else None)
+                _, seq, job = heapq.heappop(self._queue)
+            # 取得元ごとの同時実行数の上限はユーザーのリクエストと共有する
+            future = scheduler.submit(job.source, job.fn)
+            future.add_done_callback(partial(self._done, seq, job, time.time()))
+
+    def _done(self, seq, job, started_at, future):
+        error = future.exception()
+        if error is not None:
+            logger.warning("キャッシュの事前更新に失敗しました（%s）: %s", job.name, error)
+        self.last_runs[job.name] = {
+            "started_at": started_at,
+            "duration": time.time() - started_at,
+            "error": None if error is None else str(error),
+        }
+        delay = job.interval if error is None else min(job.interval, self.retry_delay)
+        with self._cond:
+            if job.name in self._rerun:
+                self._rerun.discard(job.name)
+                delay = 0
+            heapq.heappush(self._queue, (time.time() + delay, seq, job))
+            if error is None:
+                for name in job.then:
+                    self._trigger(name)
+            self._cond.notify()
+
+    def _trigger(self, name):
+        # 待機中なら実行予定を今に早める。実行中なら終わった後にもう一度実行する（_cond を持って呼ぶ）
+        for i, (_, seq, job) in enumerate(self._queue):
+            if job.name == name:
+                self._queue[i] = (time.time(), seq, job)
+                heapq.heapify(self._queue)
+                return
+        self._rerun.add(name)
+
+    def stats(self):
+        with self._cond:
+            pending = {job.name: due for due, _, job in self._queue}
+        return {
+            name: {**self.last_runs.get(name, {}), "next_run_at": pending.get(name)}
+            for name in (job.name for job in self._jobs)
+        }
+
+
+cache_warmer = CacheWarmer(default_jobs())
+
+
+def start_cache_warmer():
+    # Streamlit の再実行ごとに呼ばれても、プロセスで 1 度だけ起動する
+    if CACHE_WARMER_ENABLED:
+        cache_warmer.start()
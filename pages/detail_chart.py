@@ -2,9 +2,15 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
-from config.indicators import indicators_by_category
-from data.fetcher import fetch_data, fetch_japan_bond_yield_mof
+from services.indicators import fetch_indicator_frame, label_info
+from components.debug_panel import render_debug_panel
+from data.warmer import start_cache_warmer
 import plotly.graph_objects as go
+from data.pyramid import get_pyramid, LEVEL_LABELS
+from services.moving_average import get_ma_engine
+from utils.chart import line_trace, use_webgl
+
+DETAIL_MAX_POINTS = 600  # 表示範囲の点数がこれを超える場合は週足・月足に切り替える
 
 # クエリパラメータから対象ラベルを取得
 query_params = st.query_params
@@ -20,13 +26,11 @@ label = symbol
 st.set_page_config(page_title="詳細グラフ", layout="wide")
 st.title(f"📈 {label} 詳細")
 
-# ラベルからカテゴリ付きの情報を逆引き
-label_to_info = {}
-for cat, group in indicators_by_category.items():
-    for lbl, inf in group.items():
-        label_to_info[lbl] = {**inf, "category": cat}
+# 全指標・ニュースのキャッシュをバックグラウンドで期限切れ前に更新する（プロセスで 1 度だけ起動）
+start_cache_warmer()
 
-info = label_to_info.get(label)
+# ラベルからカテゴリ付きの情報を逆引き
+info = label_info(label)
 
 if not info:
     st.error(f"{label} の情報が見つかりません。")
@@ -65,20 +69,25 @@ end_date_display = datetime.combine(end_date, datetime.min.time())
 # ✅ 移動平均の設定（サイドバー）
 show_ma = st.sidebar.checkbox("移動平均線を表示", value=True)
 ma_periods = st.sidebar.multiselect("移動平均期間（日）", [5, 10, 20, 25, 50, 75, 100, 200, 360], default=[5, 20])
+ma_type = st.sidebar.radio("移動平均の種類", ["単純（SMA）", "指数（EMA）"], horizontal=True)
+show_bollinger = st.sidebar.checkbox("ボリンジャーバンド（20日・±2σ）", value=False)
+
+# 最長プリセットまでまとめて取得しておき、期間の切り替えは事前集計済みデータの切り出しで済ませる
+longest_start = datetime.combine(today - preset_options["10年"], datetime.min.time())
 
 # 移動平均用にデータ取得期間を延長
-fetch_start_date = start_date_display - timedelta(days=360 + max(ma_periods, default=0))
+fetch_start_date = min(start_date_display, longest_start) - timedelta(days=360 + max(ma_periods, default=0))
 
 # データ取得
-if info.get("is_mof"):
-    df = fetch_japan_bond_yield_mof(fetch_start_date, end_date_display, term=info.get("term", "10年"))
-else:
-    df = fetch_data(info["ticker"], fetch_start_date, end_date_display)
+df = fetch_indicator_frame(label, fetch_start_date, end_date_display)
 
 if df.empty:
     st.warning(f"{label} のデータが取得できませんでした。")
     st.stop()
 
+if df.attrs.get("stale"):
+    st.warning(f"{label} の最新データを取得できなかったため、保存済みのデータを表示しています。")
+
 # 'Close' 列に揃える
 if "Close" not in df.columns:
     if df.shape[1] == 1:
@@ -88,38 +97,61 @@ if "Close" not in df.columns:
         st.write("データ列名一覧:", df.columns.tolist())
         st.stop()
 
-# 移動平均を計算
+# 移動平均を計算（系列ごとにキャッシュされ、新しいデータの分だけ追加計算される）
+ma_engine = get_ma_engine(label)
+ma_engine.update(df["Close"])
 if show_ma:
-    for period in ma_periods:
-        df[f"MA{period}"] = df["Close"].rolling(window=period).mean()
+    if ma_type == "指数（EMA）":
+        ma_df = ma_engine.ema(ma_periods)
+        ma_df.columns = [f"MA{period}" for period in ma_periods]
+    else:
+        ma_df = ma_engine.sma(ma_periods)
+
+# 表示範囲の点数に合った粒度（日足・週足・月足）を選ぶ
+pyramid = get_pyramid(label)
+pyramid.update(df["Close"])
+display_end = end_date_display + timedelta(days=1) if info.get("is_mof") else end_date_display
+level, df_display = pyramid.select(start_date_display, display_end, DETAIL_MAX_POINTS)
 
-# 表示範囲でフィルタリング
-df_display = df[df.index >= start_date_display]
+show_ohlc = False
+if level != "daily":
+    show_ohlc = st.sidebar.checkbox(f"ローソク足で表示（{LEVEL_LABELS[level]}）", value=False)
 
 # ✅ グラフ描画
 try:
     fig = go.Figure()
-
-    # 終値（実線）
-    fig.add_trace(go.Scatter(
-        x=df_display.index,
-        y=df_display["Close"],
-        mode="lines",
-        name="終値",
-        line=dict(dash="solid")
-    ))
+    # 折れ線の本数 × 表示範囲の点数で WebGL 描画にするかを決める
+    line_count = (0 if show_ohlc else 1) + (len(ma_periods) if show_ma else 0) + (2 if show_bollinger else 0)
+    webgl = use_webgl(line_count * len(df_display))
+
+    # 終値（実線）。週足・月足はローソク足も選べる
+    if show_ohlc:
+        fig.add_trace(go.Candlestick(
+            x=df_display.index,
+            open=df_display["open"],
+            high=df_display["high"],
+            low=df_display["low"],
+            close=df_display["close"],
+            name=LEVEL_LABELS[level]
+        ))
+        fig.update_layout(xaxis_rangeslider_visible=False)
+    else:
+        fig.add_trace(line_trace(df_display["close"], "終値", webgl=webgl, line=dict(dash="solid")))
 
     # 移動平均（点線）
     if show_ma:
         for period in ma_periods:
             ma_col = f"MA{period}"
-            fig.add_trace(go.Scatter(
-                x=df_display.index,
-                y=df_display[ma_col],
-                mode="lines",
-                name=f"{period}日移動平均",
-                line=dict(dash="dot")
-            ))
+            # 日足で計算した移動平均を、表示粒度の各期間の最終日で取り出す
+            ma_values = ma_df[ma_col].reindex(df_display.index)
+            ma_name = f"{period}日指数移動平均" if ma_type == "指数（EMA）" else f"{period}日移動平均"
+            fig.add_trace(line_trace(ma_values, ma_name, webgl=webgl, line=dict(dash="dot")))
+
+    # ボリンジャーバンド（±2σ）
+    if show_bollinger:
+        bands = ma_engine.bollinger(20, 2.0).reindex(df_display.index)
+        for column, name in [("upper", "ボリンジャーバンド +2σ"), ("lower", "ボリンジャーバンド -2σ")]:
+            fig.add_trace(line_trace(bands[column], name, webgl=webgl, line=dict(dash="dash", width=1)))
 
     # 縦軸タイトルの設定
     yaxis_label = "利回り（％）" if category == "国債" else "価格"
@@ -133,6 +165,7 @@ try:
     )
 
     st.plotly_chart(fig, use_container_width=True)
+    st.caption(f"表示粒度: {LEVEL_LABELS[level]}（{len(df_display)}点）")
 
     # ✅ 解説文の表示（展開状態）
     description = info.get("description")
@@ -142,3 +175,6 @@ try:
 
 except Exception as e:
     st.error(f"{label} のグラフ描画中にエラーが発生しました: {e}")
+
+# 取得の計測パネル（DEBUG_PANEL=1 または ?debug=1 の場合だけ表示）。このページの取得を含めるため最後に描画する
+render_debug_panel()
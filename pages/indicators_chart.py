@@ -2,15 +2,20 @@ import streamlit as st
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 import pandas as pd
-import plotly.express as px
-from config.indicators import indicators_by_category
-from data.fetcher import fetch_data, fetch_japan_bond_yield_mof
-from utils.chart import plot_comparison_chart
+from config.indicators import indicators_by_category, default_labels
+from components.debug_panel import render_debug_panel
+from data.warmer import start_cache_warmer
+from services.indicators import fetch_indicator_frames, CUSTOM_PREFIX
+from services.panel import IndicatorPanel
+from utils.chart import plot_comparison_chart, plot_line_chart
 
 # ページ設定
 st.set_page_config(page_title="指標グラフ", layout="wide")
 st.title("\U0001F4C8 指標グラフ")
 
+# 全指標・ニュースのキャッシュをバックグラウンドで期限切れ前に更新する（プロセスで 1 度だけ起動）
+start_cache_warmer()
+
 # 表示期間プリセット（relativedelta 対応）
 st.sidebar.markdown("### 表示期間の指定")
 today = datetime.today().date()
@@ -43,12 +48,7 @@ mode = st.sidebar.radio("表示モード", ["個別グラフ", "比較グラフ
 
 # セッションステートでチェック状態を管理
 if "selected_labels" not in st.session_state:
-    default_selected = []
-    for category, items in indicators_by_category.items():
-        for label, info in items.items():
-            if info.get("default", False):
-                default_selected.append(label)
-    st.session_state.selected_labels = default_selected
+    st.session_state.selected_labels = list(default_labels)
 
 # 指標選択（カテゴリ別）
 st.sidebar.markdown("### 表示する指標を選択")
@@ -71,88 +71,56 @@ st.sidebar.markdown("### 任意のティッカーを入力")
 custom_ticker_input = st.sidebar.text_input("カンマ区切りで複数入力可 (例: AAPL, MSFT)")
 custom_tickers = [ticker.strip().upper() for ticker in custom_ticker_input.split(",") if ticker.strip()]
 
-# ラベル→情報辞書
-label_to_info = {
-    label: info for group in indicators_by_category.values() for label, info in group.items()
-}
+# yfinance の指標とカスタムティッカーはまとめて一括取得
+all_labels = st.session_state.selected_labels + [f"{CUSTOM_PREFIX}{t}" for t in custom_tickers]
+indicator_frames = fetch_indicator_frames(all_labels, start_date, end_date)
 
 # 比較グラフ（変化率）
 if mode == "比較グラフ（変化率）":
-    combined_df = pd.DataFrame()
-    all_labels = st.session_state.selected_labels + [f"カスタム: {t}" for t in custom_tickers]
-
-    for label in st.session_state.selected_labels:
-        info = label_to_info[label]
-        if info.get("is_mof"):
-            df = fetch_japan_bond_yield_mof(start_date, end_date, term=info.get("term", "10年"))
-        else:
-            df = fetch_data(info["ticker"], start_date, end_date)
+    # 各指標の系列を集めてから、日付の統一・初期値=100 への換算・補間をまとめて行う
+    frames = {}
+
+    for label in all_labels:
+        df = indicator_frames[label]
         if df.empty:
             st.warning(f"{label} のデータが取得できませんでした。")
             continue
-        df = df.rename(columns={df.columns[0]: label})
-        df[label] = pd.to_numeric(df[label], errors="coerce")
-        initial_index = df[label].first_valid_index()
-        if initial_index is None:
+        if pd.to_numeric(df.iloc[:, 0], errors="coerce").first_valid_index() is None:
             st.warning(f"{label} のデータが有効ではないため、表示できません。")
             continue
-        initial_value = df.loc[initial_index, label]
-        df[label] = df[label] / initial_value * 100
-        combined_df = df if combined_df.empty else combined_df.join(df, how="outer")
+        if df.attrs.get("stale"):
+            st.caption(f"{label} は最新データを取得できなかったため、保存済みのデータで表示しています。")
+        frames[label] = df
 
-    for ticker in custom_tickers:
-        df = fetch_data(ticker, start_date, end_date)
-        if df.empty:
-            st.warning(f"カスタム: {ticker} のデータが取得できませんでした。")
-            continue
-        label = f"カスタム: {ticker}"
-        df = df.rename(columns={df.columns[0]: label})
-        df[label] = pd.to_numeric(df[label], errors="coerce")
-        initial_index = df[label].first_valid_index()
-        if initial_index is None:
-            st.warning(f"カスタム: {ticker} のデータが有効ではないため、表示できません。")
-            continue
-        initial_value = df.loc[initial_index, label]
-        df[label] = df[label] / initial_value * 100
-        combined_df = combined_df.join(df, how="outer")
-
-    if not combined_df.empty:
-        combined_df = combined_df.sort_index().interpolate(method="linear")
+    if frames:
+        combined_df = IndicatorPanel.from_frames(frames).rebased(100).interpolated().to_frame()
         fig = plot_comparison_chart(combined_df)
-        st.plotly_chart(fig, use_container_width=True, config={"renderer": "svg"})
+        st.plotly_chart(fig, use_container_width=True)
     else:
         st.info("表示できるデータがありません。")
 
 # 個別グラフ
 else:
-    all_labels = st.session_state.selected_labels + [f"カスタム: {t}" for t in custom_tickers]
     for i, label in enumerate(all_labels):
         with st.container():
-            if label.startswith("カスタム: "):
-                ticker = label.replace("カスタム: ", "")
-                df = fetch_data(ticker, start_date, end_date)
-            else:
-                info = label_to_info[label]
-                if info.get("is_mof"):
-                    df = fetch_japan_bond_yield_mof(start_date, end_date, term=info.get("term", "10年"))
-                else:
-                    df = fetch_data(info["ticker"], start_date, end_date)
+            df = indicator_frames[label]
 
             st.subheader(label)
+            if df.attrs.get("stale"):
+                st.caption("最新データを取得できなかったため、保存済みのデータを表示しています。")
             if df.empty:
                 st.warning(f"{label} のデータが取得できませんでした。")
             else:
                 try:
-                    df_plot = df.copy()
-                    df_plot["date"] = df_plot.index
-                    df_plot = df_plot.dropna(subset=[df.columns[0]])
+                    df_plot = df.dropna(subset=[df.columns[0]])
                     if df_plot.empty:
                         st.warning(f"{label} の有効なデータが存在しないため、グラフが表示できません。")
                         continue
-                    # 5年表示のときは週単位に間引く
-                    if preset == "5年":
-                        df_plot = df_plot.set_index("date").resample("W").mean().reset_index()
-                    fig = px.line(df_plot, x="date", y=df.columns[0])
-                    st.plotly_chart(fig, use_container_width=True, config={"renderer": "svg"})
+                    # 長期間でも描画点数が一定になるよう、形を保ったまま間引く
+                    fig = plot_line_chart(df_plot, df.columns[0])
+                    st.plotly_chart(fig, use_container_width=True)
                 except Exception as e:
                     st.error(f"{label} のグラフ描画中にエラーが発生しました: {e}")
+
+# 取得の計測パネル（DEBUG_PANEL=1 または ?debug=1 の場合だけ表示）。このページの取得を含めるため最後に描画する
+render_debug_panel()
@@ -0,0 +1,72 @@
+import os
+import sqlite3
+import time
+from data.metrics import note_cache
+from data.sqlite_db import connect
+
+# ChatGPT の分析結果を入力のハッシュ値で保存する永続キャッシュ（SQLite）。再起動後・プロセス間で共有される
+ANALYSIS_CACHE_PATH = os.environ.get(
+    "ANALYSIS_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "analysis.sqlite"),
+)
+ANALYSIS_CACHE_TTL = int(os.environ.get("ANALYSIS_CACHE_TTL", 1800))  # 有効期間（秒）
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get("ANALYSIS_CACHE_MAX_ENTRIES", 500))
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS analysis (
+        key TEXT PRIMARY KEY,
+        result TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        last_used REAL NOT NULL
+    );
+"""
+
+
+def _connect():
+    return connect(ANALYSIS_CACHE_PATH, _SCHEMA)
+
+
+def get(key, ttl=ANALYSIS_CACHE_TTL):
+    # キャッシュが読めない場合は未保存として扱い、分析の生成を続ける
+    now = time.time()
+    try:
+        conn = _connect()
+        try:
+            with conn:
+                row = conn.execute(
+                    "SELECT result FROM analysis WHERE key = ? AND created_at >= ?", (key, now - ttl)
+                ).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE analysis SET last_used = ? WHERE key = ?", (now, key))
+        finally:
+            conn.close()
+    except (sqlite3.Error, OSError):
+        note_cache(False)
+        return None
+    note_cache(row is not None)
+    return row[0] if row else None
+
+
+def put(key, result, ttl=ANALYSIS_CACHE_TTL, max_entries=ANALYSIS_CACHE_MAX_ENTRIES):
+    now = time.time()
+    try:
+        conn = _connect()
+    except (sqlite3.Error, OSError):
+        return
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analysis (key, result, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, result, now, now),
+            )
+            # 期限切れの結果と、上限を超えた分（最近使われていないもの）を削除
+            conn.execute("DELETE FROM analysis WHERE created_at < ?", (now - ttl,))
+            conn.execute("""
+                DELETE FROM analysis WHERE key NOT IN (
+                    SELECT key FROM analysis ORDER BY last_used DESC LIMIT ?
+                )
+            """, (max_entries,))
+    except sqlite3.Error:
+        pass
+    finally:
+        conn.close()
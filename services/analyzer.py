@@ -1,10 +1,14 @@
-import openai
 import os
-import streamlit as st
 import hashlib
 import json
+import logging
+import time
+from data.metrics import instrumented, metrics, note_upstream
+from data.shared_cache import shared_lock
+from services import analysis_cache
+from services.prompt import build_prompt
 
-openai.api_key = os.environ["OPENAI_API_KEY"]
+logger = logging.getLogger(__name__)
 
 def _make_cache_key(changes_by_label, news_summaries, start_date, end_date):
     """キャッシュキーを安定化させるためのハッシュ関数"""
@@ -17,12 +21,12 @@ def _make_cache_key(changes_by_label, news_summaries, start_date, end_date):
     key_str = json.dumps(key_data, sort_keys=True, ensure_ascii=False)
     return hashlib.md5(key_str.encode("utf-8")).hexdigest()
 
-@st.cache_data(ttl=1800, show_spinner="ChatGPTで分析中...")
-def generate_analysis(changes_by_label, news_summaries, start_date, end_date):
-    try:
-        cache_key = _make_cache_key(changes_by_label, news_summaries, start_date, end_date)
+ANALYSIS_MODEL = "gpt-4"
+SYSTEM_PROMPT = "あなたは世界経済を分析する有能なアナリストです。"
+PROMPT_TOKEN_BUCKETS = (250, 500, 1000, 1500, 2000, 3000, 4000, 8000)
 
-        summary_prompt = f"""
+def _build_prompt(changes_by_label, news_summaries, start_date, end_date):
+    header = f"""
 以下は世界経済に関する指標の変化率データです。
 分析対象期間は {start_date.date()} から {end_date.date()} です。
 この情報に加えて、期間中に報道された重要ニュースやWebの情報も参考にして、現在の世界経済の動向と注目ポイントを日本語で簡潔に分析してください。
@@ -32,28 +36,116 @@ def generate_analysis(changes_by_label, news_summaries, start_date, end_date):
 
 【指標の変化率】
 """
-        for label, changes in changes_by_label.items():
-            summary_prompt += f"- {label}:"
-            summary_prompt += f"  - 直近5日: {changes.get('5d', 0):+.2f}%\n"
-            summary_prompt += f"  - 過去1か月: {changes.get('1mo', 0):+.2f}%\n"
-            summary_prompt += f"  - 過去3か月: {changes.get('3mo', 0):+.2f}%\n"
-            summary_prompt += f"  - 分析対象期間: {changes.get('range', 0):+.2f}%\n"
+    indicator_section = ""
+    for label, changes in changes_by_label.items():
+        indicator_section += f"- {label}:"
+        indicator_section += f"  - 直近5日: {changes.get('5d', 0):+.2f}%\n"
+        indicator_section += f"  - 過去1か月: {changes.get('1mo', 0):+.2f}%\n"
+        indicator_section += f"  - 過去3か月: {changes.get('3mo', 0):+.2f}%\n"
+        indicator_section += f"  - 分析対象期間: {changes.get('range', 0):+.2f}%\n"
+
+    footer = "\n\n注目すべきポイントを3つ程度、箇条書きで示してください。"
+
+    # 重複ニュースの除去・関連度順の並べ替え・トークン予算での切り詰め
+    summary_prompt, stats = build_prompt(header, indicator_section, news_summaries, changes_by_label, footer)
+    _record_prompt_stats(stats)
+    logger.info(
+        "analysis prompt: %d tokens (untrimmed %d), news %d -> %d unique -> %d used",
+        stats["prompt_tokens"], stats["untrimmed_tokens"],
+        stats["news_total"], stats["news_unique"], stats["news_used"],
+    )
+    return summary_prompt
 
-        if news_summaries:
-            summary_prompt += "\n【期間中の主な経済ニュース】\n"
-            summary_prompt += "\n".join([f"- {news}" for news in news_summaries[:50]])
+def _record_prompt_stats(stats):
+    # プロンプトのトークン数と、重複除去・予算での切り詰めで減ったニュースの件数を計測に記録する
+    metrics.observe("analysis_prompt_tokens", stats["prompt_tokens"], buckets=PROMPT_TOKEN_BUCKETS)
+    metrics.inc("analysis_prompt_trimmed_tokens_total", max(stats["untrimmed_tokens"] - stats["prompt_tokens"], 0))
+    for stage in ("total", "unique", "used"):
+        metrics.inc("analysis_news_items_total", stats[f"news_{stage}"], stage=stage)
 
-        summary_prompt += "\n\n注目すべきポイントを3つ程度、箇条書きで示してください。"
+def _api_key():
+    # API キーは分析を生成する時に確認する（未設定でもダッシュボードの他の部分は動く）
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY が設定されていません。")
+    return api_key
 
+def _create_completion(summary_prompt, stream=False):
+    # openai は読み込みに時間がかかるため、初めて分析を生成する時に読み込む
+    api_key = _api_key()
+    import openai
+    openai.api_key = api_key
+    # ストリーミングの場合は応答が始まるまでの時間
+    started = time.perf_counter()
+    try:
         response = openai.chat.completions.create(
-            model="gpt-4",
+            model=ANALYSIS_MODEL,
             messages=[
-                {"role": "system", "content": "あなたは世界経済を分析する有能なアナリストです。"},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": summary_prompt}
             ],
-            temperature=0.7
+            temperature=0.7,
+            stream=stream
         )
-        return response.choices[0].message.content.strip()
+    except Exception:
+        note_upstream("openai", started, "error")
+        raise
+    nbytes = 0 if stream else len((response.choices[0].message.content or "").encode("utf-8"))
+    note_upstream("openai", started, "ok", nbytes)
+    return response
+
+@instrumented("generate_analysis")
+def generate_analysis(changes_by_label, news_summaries, start_date, end_date):
+    # 全文をまとめて返す（バッチ処理用）。結果は永続キャッシュで共有される
+    try:
+        cache_key = _make_cache_key(changes_by_label, news_summaries, start_date, end_date)
+        cached = analysis_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # 他のプロセスが同じ入力で生成中なら、終わるのを待って結果を使う
+        with shared_lock(f"analysis:{cache_key}"):
+            cached = analysis_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+            response = _create_completion(_build_prompt(changes_by_label, news_summaries, start_date, end_date))
+            comment = response.choices[0].message.content.strip()
+            analysis_cache.put(cache_key, comment)
+            return comment
 
     except Exception as e:
         return f"コメント生成中にエラーが発生しました: {e}"
+
+@instrumented("stream_analysis")
+def stream_analysis(changes_by_label, news_summaries, start_date, end_date):
+    # 生成されたテキストを届いた順に返す（st.write_stream 用）。完了したら全文をキャッシュに保存する
+    try:
+        cache_key = _make_cache_key(changes_by_label, news_summaries, start_date, end_date)
+        cached = analysis_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+        # 他のプロセスが同じ入力で生成中なら、終わるのを待って結果を使う
+        with shared_lock(f"analysis:{cache_key}"):
+            cached = analysis_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+            parts = []
+            for chunk in _create_completion(_build_prompt(changes_by_label, news_summaries, start_date, end_date), stream=True):
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+
+            comment = "".join(parts).strip()
+            metrics.inc("upstream_bytes_total", len(comment.encode("utf-8")), source="openai")
+            analysis_cache.put(cache_key, comment)
+
+    except Exception as e:
+        yield f"コメント生成中にエラーが発生しました: {e}"
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from datetime import timedelta
+
+# 変化率を計算する期間（終了日からの遡り幅）。relativedelta や「終了日→開始日」の関数も指定できる
+PERIOD_OFFSETS = OrderedDict({
+    "5d": timedelta(days=7),
+    "1mo": timedelta(days=30),
+    "3mo": timedelta(days=90)
+})
+
+
+def _to_datetime64(value):
+    return pd.Timestamp(value).to_datetime64().astype("datetime64[ns]")
+
+
+def _window_start(end_date, offset):
+    return offset(end_date) if callable(offset) else end_date - offset
+
+
+def compute_changes(panel, start_date, end_date, range_option, diff_labels=(), offsets=PERIOD_OFFSETS):
+    # 全指標・全期間の変化を一括で計算する。diff_labels は変化率ではなく差分（国債利回りなど）で表す指標
+    values = panel.values
+    n, k = values.shape
+    if k == 0:
+        return {}
+
+    valid = ~np.isnan(values)
+    positions = np.arange(n)[:, None]
+    # 各行以前で最後の有効行 / 各行以降で最初の有効行（末尾に番兵行 n を追加）
+    last_valid = np.maximum.accumulate(np.where(valid, positions, -1), axis=0)
+    next_valid = np.minimum.accumulate(np.where(valid, positions, n)[::-1], axis=0)[::-1]
+    next_valid = np.vstack([next_valid, np.full((1, k), n)])
+    # counts[i] は i 行目より前の有効データ数
+    counts = np.vstack([np.zeros((1, k), dtype=int), np.cumsum(valid, axis=0)])
+
+    cols = np.arange(k)
+    is_diff = np.isin(np.array(panel.labels, dtype=object), list(diff_labels))
+
+    def change(v0, v1):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(is_diff, v1 - v0, (v1 - v0) / v0 * 100)
+
+    def gather(pos):
+        # 列ごとの行位置 pos の値を取り出す
+        if n == 0:
+            return np.full(pos.shape, np.nan)
+        return values[np.clip(pos, 0, n - 1), cols]
+
+    # 終了日以前の最終データ
+    end = int(np.searchsorted(panel.dates, _to_datetime64(end_date), side="right"))
+    count_to_end = counts[end]
+    last_pos = last_valid[end - 1] if end > 0 else np.full(k, -1)
+    end_values = gather(last_pos)
+
+    # 各期間の開始位置を二分探索でまとめて求め、期間内の最初の有効データと比較する
+    window_keys = list(offsets)
+    window_starts = [_window_start(end_date, offsets[key]) for key in window_keys]
+    if range_option != "前日比":
+        window_starts.append(start_date)
+    lo = np.searchsorted(panel.dates, np.array([_to_datetime64(s) for s in window_starts]), side="left")
+    first_pos = next_valid[lo]
+    window_ok = (count_to_end[None, :] - counts[lo]) >= 2
+    window_changes = change(gather(first_pos), end_values[None, :])
+
+    if range_option == "前日比":
+        prev_pos = last_valid[np.clip(last_pos - 1, 0, n - 1), cols] if n else np.full(k, -1)
+        range_ok = count_to_end >= 2
+        range_changes = change(gather(prev_pos), end_values)
+        range_error = "の期間内データが不十分です。"
+    else:
+        range_ok = window_ok[-1]
+        range_changes = window_changes[-1]
+        range_error = "の指定期間データが不十分です。"
+
+    results = {}
+    for j, label in enumerate(panel.labels):
+        if not range_ok[j]:
+            results[label] = {"error": range_error}
+            continue
+
+        history_changes = {
+            key: float(window_changes[w, j])
+            for w, key in enumerate(window_keys)
+            if window_ok[w, j]
+        }
+        history_changes["range"] = float(range_changes[j])
+        results[label] = {
+            "end_value": float(end_values[j]),
+            "range": float(range_changes[j]),
+            "changes": history_changes,
+            "last_date": pd.Timestamp(panel.dates[last_pos[j]]),
+        }
+    return results
@@ -0,0 +1,111 @@
+import pandas as pd
+from config.indicators import indicators_by_category, category_order, label_to_info, ordered_labels, bond_labels
+from data.fetcher import fetch_data, fetch_data_batch, fetch_japan_bond_yield_mof
+from data.news_fetcher import fetch_market_news
+from data.scheduler import scheduler
+from services.changes import compute_changes
+from services.panel import IndicatorPanel
+
+# 指標の取得と変化の計算（Streamlit に依存しない）。ダッシュボード・グラフページ・CLI が共通で使う
+CUSTOM_PREFIX = "カスタム: "
+
+
+def label_info(label):
+    # カテゴリ付きの指標情報。未知のラベルは None
+    return label_to_info.get(label)
+
+
+def build_fetch_tasks(fetch_start_date, end_date, news_range=None):
+    # scheduler.as_completed 用のタスクと、タスク名 → 対象ラベルの対応を返す。
+    # yfinance の指標はカテゴリごとに一括取得し、MOF 利回りは年限ごとに取得する
+    tasks = {}
+    task_labels = {}
+    if news_range is not None:
+        tasks["news"] = ("marketaux", fetch_market_news, *news_range)
+
+    for category in category_order:
+        items = indicators_by_category.get(category, {})
+        tickers = [info["ticker"] for info in items.values() if not info.get("is_mof")]
+        if tickers:
+            tasks[category] = ("yfinance", fetch_data_batch, tickers, fetch_start_date, end_date)
+            task_labels[category] = [label for label, info in items.items() if not info.get("is_mof")]
+        for label, info in items.items():
+            if info.get("is_mof"):
+                tasks[label] = ("mof", fetch_japan_bond_yield_mof, fetch_start_date, end_date, info.get("term", "10年"))
+                task_labels[label] = [label]
+    return tasks, task_labels
+
+
+def _task_changes(future, labels, start_date, end_date, range_option):
+    # 1 つのタスクの結果から、対象ラベルごとの変化（または {"error": ...}）を計算する
+    results = {}
+    frames = {}
+    for label in labels:
+        info = label_to_info[label]
+        try:
+            df = future.result() if info.get("is_mof") else future.result().get(info["ticker"], pd.DataFrame())
+        except Exception as e:
+            results[label] = {"error": f"の取得中にエラーが発生しました: {e}"}
+            continue
+        if df.empty:
+            results[label] = {"error": "のデータが空です。"}
+            continue
+        frames[label] = df
+
+    panel = IndicatorPanel.from_frames(frames)
+    results.update(compute_changes(panel, start_date, end_date, range_option, diff_labels=bond_labels))
+    # 取得に失敗して保存済みのデータで計算した指標には印を付ける
+    for label, df in frames.items():
+        if df.attrs.get("stale") and "error" not in results[label]:
+            results[label]["stale"] = True
+    return results
+
+
+def iter_indicator_changes(start_date, end_date, range_option, fetch_start_date, news_range=None):
+    # 取得が終わったタスクから順に (タスク名, 結果) を返す。
+    # 指標のタスクの結果は {ラベル: 変化}、"news" の結果はニュース要約のリスト
+    tasks, task_labels = build_fetch_tasks(fetch_start_date, end_date, news_range)
+    for name, future in scheduler.as_completed(tasks):
+        if name == "news":
+            try:
+                news_summaries = future.result()
+            except Exception as e:
+                news_summaries = [f"[ニュース取得エラー]: {e}"]
+            yield name, news_summaries
+            continue
+        yield name, _task_changes(future, task_labels[name], start_date, end_date, range_option)
+
+
+def changes_by_label(results):
+    # 分析用の {ラベル: 期間ごとの変化}。取得の完了順に左右されないよう表示順に揃える
+    return {
+        label: results[label]["changes"]
+        for label in ordered_labels
+        if label in results and "error" not in results[label]
+    }
+
+
+def fetch_indicator_frames(labels, start_date, end_date):
+    # グラフ表示用に {ラベル: DataFrame} を返す。yfinance の指標と "カスタム: " ティッカーは一括取得する
+    tickers = {}
+    for label in labels:
+        if label.startswith(CUSTOM_PREFIX):
+            tickers[label] = label[len(CUSTOM_PREFIX):]
+        elif not label_to_info[label].get("is_mof"):
+            tickers[label] = label_to_info[label]["ticker"]
+    batch_data = fetch_data_batch(list(tickers.values()), start_date, end_date) if tickers else {}
+
+    frames = {}
+    for label in labels:
+        if label in tickers:
+            frames[label] = batch_data.get(tickers[label], pd.DataFrame())
+        else:
+            frames[label] = fetch_japan_bond_yield_mof(start_date, end_date, term=label_to_info[label].get("term", "10年"))
+    return frames
+
+
+def fetch_indicator_frame(label, start_date, end_date):
+    info = label_to_info[label]
+    if info.get("is_mof"):
+        return fetch_japan_bond_yield_mof(start_date, end_date, term=info.get("term", "10年"))
+    return fetch_data(info["ticker"], start_date, end_date)
@@ -0,0 +1,145 @@
+import threading
+import numpy as np
+import pandas as pd
+
+# 系列ごとに累積和を保持し、複数期間の移動平均（SMA・EMA・ボリンジャーバンド）をまとめて計算・キャッシュする
+
+
+class MovingAverageEngine:
+    def __init__(self):
+        self._dates = pd.DatetimeIndex([], name="date")
+        self._values = np.empty(0)
+        # _csum[i] / _csum_sq[i] は先頭 i 個の値の和 / 二乗和
+        self._csum = np.zeros(1)
+        self._csum_sq = np.zeros(1)
+        self._sma = {}
+        self._std = {}
+        self._ema = {}
+        self._lock = threading.Lock()
+
+    def update(self, series):
+        # 末尾に追加されたデータ分だけ累積和とキャッシュ済みの各期間を延長する
+        series = series.dropna().sort_index().astype("float64")
+        if series.empty:
+            return
+
+        with self._lock:
+            dates = self._dates
+            if len(dates) == 0 or series.index[0] < dates[0]:
+                merged = pd.concat([series, pd.Series(self._values, index=dates)[dates > series.index[-1]]])
+                self._reset(merged.index, merged.to_numpy())
+                return
+
+            # 受け取った範囲で保存済みの値と違う最初の日（過去分の改訂・新しい日）から後ろを計算し直す
+            values = pd.Series(self._values, index=dates)
+            stored = values.reindex(series.index)
+            changed = series.index[(stored != series).to_numpy()]
+            if changed.empty:
+                return
+
+            start = changed[0]
+            new = pd.concat([series[series.index >= start], values[values.index > series.index[-1]]])
+            self._truncate(int(dates.searchsorted(start)))
+            self._append(new.index, new.to_numpy())
+
+    def _reset(self, dates, values):
+        self._dates = pd.DatetimeIndex(dates, name="date")
+        self._values = np.asarray(values, dtype="float64")
+        self._csum = np.concatenate([[0.0], np.cumsum(self._values)])
+        self._csum_sq = np.concatenate([[0.0], np.cumsum(self._values ** 2)])
+        self._sma.clear()
+        self._std.clear()
+        self._ema.clear()
+
+    def _truncate(self, n):
+        self._dates = self._dates[:n]
+        self._values = self._values[:n]
+        self._csum = self._csum[:n + 1]
+        self._csum_sq = self._csum_sq[:n + 1]
+        for cache in (self._sma, self._std, self._ema):
+            for key in cache:
+                cache[key] = cache[key][:n]
+
+    def _append(self, dates, values):
+        start = len(self._values)
+        self._dates = self._dates.append(pd.DatetimeIndex(dates)).rename("date")
+        self._values = np.concatenate([self._values, values])
+        self._csum = np.concatenate([self._csum, self._csum[-1] + np.cumsum(values)])
+        self._csum_sq = np.concatenate([self._csum_sq, self._csum_sq[-1] + np.cumsum(values ** 2)])
+        for window in self._sma:
+            self._sma[window] = np.concatenate([self._sma[window], self._rolling_mean(window, start)])
+        for window in self._std:
+            self._std[window] = np.concatenate([self._std[window], self._rolling_std(window, start)])
+        for span in self._ema:
+            self._ema[span] = np.concatenate([self._ema[span], self._ema_from(span, start)])
+
+    def _rolling_mean(self, window, start=0):
+        # 位置 start 以降の単純移動平均（データが window 個に満たない位置は NaN）
+        end = np.arange(start, len(self._values)) + 1
+        begin = end - window
+        result = np.full(len(end), np.nan)
+        ok = begin >= 0
+        result[ok] = (self._csum[end[ok]] - self._csum[begin[ok]]) / window
+        return result
+
+    def _rolling_std(self, window, start=0):
+        # 標本標準偏差（pandas の rolling().std() と同じ ddof=1）
+        end = np.arange(start, len(self._values)) + 1
+        begin = end - window
+        result = np.full(len(end), np.nan)
+        ok = (begin >= 0) & (window > 1)
+        s1 = self._csum[end[ok]] - self._csum[begin[ok]]
+        s2 = self._csum_sq[end[ok]] - self._csum_sq[begin[ok]]
+        result[ok] = np.sqrt(np.clip((s2 - s1 ** 2 / window) / (window - 1), 0, None))
+        return result
+
+    def _ema_from(self, span, start):
+        # pandas の ewm(span=span, adjust=False).mean() と同じ漸化式で位置 start 以降を計算する
+        values = self._values[start:]
+        if start == 0:
+            return pd.Series(values).ewm(span=span, adjust=False).mean().to_numpy()
+        alpha = 2 / (span + 1)
+        result = np.empty(len(values))
+        prev = self._ema[span][start - 1]
+        for i, value in enumerate(values):
+            prev = alpha * value + (1 - alpha) * prev
+            result[i] = prev
+        return result
+
+    def sma(self, windows):
+        with self._lock:
+            for window in windows:
+                if window not in self._sma:
+                    self._sma[window] = self._rolling_mean(window)
+            return pd.DataFrame({f"MA{w}": self._sma[w] for w in windows}, index=self._dates)
+
+    def ema(self, spans):
+        with self._lock:
+            for span in spans:
+                if span not in self._ema:
+                    self._ema[span] = self._ema_from(span, 0)
+            return pd.DataFrame({f"EMA{s}": self._ema[s] for s in spans}, index=self._dates)
+
+    def bollinger(self, window=20, num_std=2.0):
+        with self._lock:
+            if window not in self._sma:
+                self._sma[window] = self._rolling_mean(window)
+            if window not in self._std:
+                self._std[window] = self._rolling_std(window)
+            mid, std = self._sma[window], self._std[window]
+            return pd.DataFrame({
+                "middle": mid,
+                "upper": mid + num_std * std,
+                "lower": mid - num_std * std,
+            }, index=self._dates)
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_ma_engine(key):
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = MovingAverageEngine()
+        return _engines[key]
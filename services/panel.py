@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+
+class IndicatorPanel:
+    """複数指標の値を 1 つの日付インデックスに揃えた横長の配列（欠損は NaN）"""
+
+    def __init__(self, dates, labels, values):
+        self.dates = dates
+        self.labels = labels
+        self.values = values
+
+    @classmethod
+    def from_frames(cls, frames):
+        # frames: {ラベル: 先頭列が値の DataFrame}。全系列の日付をまとめて 1 回で揃える
+        labels = list(frames)
+        indexes = [pd.DatetimeIndex(frames[label].index).values.astype("datetime64[ns]") for label in labels]
+        if indexes:
+            dates = np.unique(np.concatenate(indexes))
+        else:
+            dates = np.array([], dtype="datetime64[ns]")
+
+        values = np.full((len(dates), len(labels)), np.nan)
+        for j, (label, index) in enumerate(zip(labels, indexes)):
+            column = pd.to_numeric(frames[label].iloc[:, 0], errors="coerce").to_numpy(dtype="float64")
+            values[np.searchsorted(dates, index), j] = column
+        return cls(dates, labels, values)
+
+    def rebased(self, base=100.0):
+        # 各指標の最初の有効値を base とした相対値に変換する
+        if self.values.size == 0:
+            return self
+        first = np.argmax(~np.isnan(self.values), axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = self.values / self.values[first, np.arange(len(self.labels))] * base
+        return IndicatorPanel(self.dates, self.labels, values)
+
+    def interpolated(self):
+        # 欠損を前後の有効値から線形補間する（DataFrame.interpolate と同様に、先頭の欠損は残し末尾は最後の値で埋める）
+        values = self.values.copy()
+        positions = np.arange(len(self.dates))
+        for j in range(len(self.labels)):
+            valid = ~np.isnan(values[:, j])
+            if not valid.any():
+                continue
+            first = int(valid.argmax())
+            values[first:, j] = np.interp(positions[first:], positions[valid], values[valid, j])
+        return IndicatorPanel(self.dates, self.labels, values)
+
+    def to_frame(self):
+        return pd.DataFrame(self.values, index=pd.DatetimeIndex(self.dates, name="date"), columns=self.labels)
@@ -0,0 +1,47 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from dateutil.relativedelta import relativedelta
+
+# ダッシュボードの表示期間プリセット（終了日からの遡り幅）。カスタムは開始日・終了日を直接指定する
+PRESET_OPTIONS = OrderedDict({
+    "前日比": timedelta(days=2),
+    "1週間": timedelta(weeks=1),
+    "1か月": relativedelta(months=1),
+    "3か月": relativedelta(months=3),
+    "1年": relativedelta(years=1),
+    "5年": relativedelta(years=5),
+    "10年": relativedelta(years=10),
+    "カスタム": None
+})
+CUSTOM_PRESET = "カスタム"
+
+HISTORY_DAYS = 90  # 5d/1mo/3mo の変化率用に開始日より前から取得する日数
+
+
+def _to_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    return datetime.combine(value, datetime.min.time())
+
+
+def preset_range(range_option, today=None):
+    # プリセットの (開始日, 終了日) を datetime で返す
+    if today is None:
+        today = datetime.today().date()
+    delta = PRESET_OPTIONS.get(range_option)
+    if delta is None:
+        raise ValueError(f"{range_option} は期間を決められないプリセットです。")
+    return _to_datetime(today - delta), _to_datetime(today)
+
+
+def fetch_window(range_option, start_date, end_date):
+    # 指標の取得開始日と、ニュースの取得期間 [news_start, news_end) を返す
+    fetch_start_date = start_date - timedelta(days=HISTORY_DAYS)
+
+    if range_option == "前日比":
+        news_start = datetime.combine(end_date.date() - timedelta(days=1), datetime.min.time())
+        news_end = datetime.combine(end_date.date() + timedelta(days=1), datetime.min.time())
+    else:
+        news_start = start_date
+        news_end = end_date + timedelta(days=1)
+    return fetch_start_date, news_start, news_end
@@ -0,0 +1,118 @@
+import os
+import re
+from config.indicators import indicators_by_category, label_to_info
+
+# 分析プロンプトの組み立て：ニュースの重複除去 → 指標の動きとの関連度で並べ替え → トークン予算内に収める
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", 3000))
+MAX_NEWS = 50
+DUPLICATE_THRESHOLD = 0.6  # 見出しの単語の Jaccard 係数がこれ以上なら重複とみなす
+BOND_CHANGE_SCALE = 10.0  # 国債は利回りの差分なので、0.1%pt の変化を 1% の変化率と同程度とみなす
+
+# カテゴリごとに英語ニュースで使われる語
+CATEGORY_KEYWORDS = {
+    "株価指数": ["stock", "stocks", "equity", "equities", "shares", "index"],
+    "国債": ["bond", "bonds", "yield", "yields", "treasury", "treasuries", "jgb"],
+    "為替": ["dollar", "yen", "euro", "pound", "yuan", "currency", "forex"],
+    "コモディティ": ["oil", "crude", "gold", "silver", "copper", "gas", "wheat", "soybeans", "commodity", "commodities"],
+    "仮想通貨": ["crypto", "cryptocurrency", "bitcoin", "ethereum", "solana", "binance"],
+}
+
+_WORD = re.compile(r"[a-z0-9&$]+")
+
+
+def _words(text):
+    return set(_WORD.findall(text.lower()))
+
+
+def _label_keywords(label, category):
+    # ラベル中の英字（例: "S&P 500（SPY）" → s&p, spy）とカテゴリの語
+    words = {w for w in _words(label) if not w.isdigit() and len(w) > 1}
+    return words | set(CATEGORY_KEYWORDS.get(category, []))
+
+
+_LABEL_KEYWORDS = {
+    label: _label_keywords(label, category)
+    for category, items in indicators_by_category.items()
+    for label in items
+}
+
+
+def count_tokens(text):
+    # tiktoken があれば正確に数え、なければ概算（ASCII は約 4 文字、それ以外は 1 文字で 1 トークン）
+    try:
+        import tiktoken
+    except ImportError:
+        ascii_chars = sum(1 for c in text if ord(c) < 128)
+        return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+    return len(tiktoken.get_encoding("cl100k_base").encode(text))
+
+
+def _title(summary):
+    return summary.split("\n", 1)[0].rsplit("(", 1)[0]
+
+
+def dedupe_news(news_summaries, threshold=DUPLICATE_THRESHOLD):
+    # 見出しがほぼ同じ記事は最初のもの（Marketaux の関連度が高い方）だけを残す
+    kept, kept_words = [], []
+    for summary in news_summaries:
+        words = _words(_title(summary))
+        is_duplicate = any(
+            words and other and len(words & other) / len(words | other) >= threshold
+            for other in kept_words
+        )
+        if not is_duplicate:
+            kept.append(summary)
+            kept_words.append(words)
+    return kept
+
+
+def rank_news(news_summaries, changes_by_label):
+    # 大きく動いた指標に関連する記事ほど上位にする。指標の重みは最も動いた指標を 1 とした変化の大きさ
+    moves = {}
+    for label, changes in changes_by_label.items():
+        if label in _LABEL_KEYWORDS:
+            scale = BOND_CHANGE_SCALE if label_to_info[label]["category"] == "国債" else 1.0
+            moves[label] = abs(changes.get("range", 0)) * scale
+    largest = max(moves.values(), default=0.0)
+    weights = {label: move / largest for label, move in moves.items()} if largest > 0 else {}
+
+    def score(summary):
+        words = _words(summary)
+        return sum(weight for label, weight in weights.items() if words & _LABEL_KEYWORDS[label])
+
+    # 同点は元の順序（Marketaux の関連度順）を保つ
+    return sorted(news_summaries, key=score, reverse=True)
+
+
+def build_prompt(header, indicator_section, news_summaries, changes_by_label, footer, token_budget=PROMPT_TOKEN_BUDGET):
+    # 指標部分は必ず含め、ニュースは関連度順に予算に収まるまで追加する。(プロンプト, トークン数の内訳) を返す
+    news_summaries = list(news_summaries[:MAX_NEWS])
+    unique_news = dedupe_news(news_summaries)
+    ranked_news = rank_news(unique_news, changes_by_label)
+
+    prompt = header + indicator_section
+    used_tokens = count_tokens(prompt + footer)
+    news_lines = []
+    for news in ranked_news:
+        line = f"- {news}"
+        line_tokens = count_tokens(line + "\n")
+        if used_tokens + line_tokens > token_budget:
+            continue
+        news_lines.append(line)
+        used_tokens += line_tokens
+
+    if news_lines:
+        prompt += "\n【期間中の主な経済ニュース】\n" + "\n".join(news_lines)
+    prompt += footer
+
+    untrimmed = header + indicator_section
+    if news_summaries:
+        untrimmed += "\n【期間中の主な経済ニュース】\n" + "\n".join(f"- {news}" for news in news_summaries)
+    stats = {
+        "prompt_tokens": count_tokens(prompt),
+        "untrimmed_tokens": count_tokens(untrimmed + footer),
+        "news_total": len(news_summaries),
+        "news_unique": len(unique_news),
+        "news_used": len(news_lines),
+    }
+    return prompt, stats
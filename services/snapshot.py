@@ -0,0 +1,227 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+import pandas as pd
+from config.indicators import ordered_labels
+from services.indicators import iter_indicator_changes, changes_by_label, label_info
+from services.periods import PRESET_OPTIONS, CUSTOM_PRESET, fetch_window, preset_range
+
+# ダッシュボードのスナップショット（全指標の最新値と 5d/1mo/3mo/期間の変化、任意で分析コメント）。
+# Streamlit なしで計算し、JSON または Parquet に書き出す
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+CHANGE_KEYS = ["5d", "1mo", "3mo", "range"]
+
+# 全プリセット分を事前計算したファイル（materialize で作成し、ダッシュボードが読み込む）
+MATERIALIZED_PATH = os.environ.get(
+    "SNAPSHOT_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "snapshots.parquet"),
+)
+MATERIALIZED_MAX_AGE = int(os.environ.get("SNAPSHOT_MAX_AGE", 3600))  # これより古い事前計算は使わない（秒）
+
+
+def _serialize_result(label, result):
+    entry = {"category": label_info(label)["category"]}
+    if "error" in result:
+        entry["error"] = result["error"]
+        return entry
+    entry.update(
+        end_value=result["end_value"],
+        range=result["range"],
+        changes=result["changes"],
+        last_date=pd.Timestamp(result["last_date"]).isoformat(),
+    )
+    if result.get("stale"):
+        entry["stale"] = True
+    return entry
+
+
+def compute_snapshot(range_option, start_date, end_date, with_analysis=False):
+    fetch_start_date, news_start, news_end = fetch_window(range_option, start_date, end_date)
+    news_range = (news_start, news_end) if with_analysis else None
+
+    results = {}
+    news_summaries = []
+    for name, payload in iter_indicator_changes(start_date, end_date, range_option, fetch_start_date, news_range):
+        if name == "news":
+            news_summaries = payload
+        else:
+            results.update(payload)
+
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "range_option": range_option,
+        "start_date": start_date.date().isoformat(),
+        "end_date": end_date.date().isoformat(),
+        "indicators": {
+            label: _serialize_result(label, results.get(label, {"error": "のデータが空です。"}))
+            for label in ordered_labels
+        },
+    }
+
+    if with_analysis:
+        # OpenAI の設定は分析するときだけ必要にする
+        from services.analyzer import generate_analysis
+        snapshot["news"] = news_summaries
+        snapshot["analysis"] = generate_analysis(changes_by_label(results), news_summaries, start_date, end_date)
+    return snapshot
+
+
+def snapshot_to_frame(snapshot):
+    # 指標ごとに 1 行の表。指標以外の項目は attrs に入れる（Parquet のメタデータとして保存される）
+    rows = []
+    for label, entry in snapshot["indicators"].items():
+        changes = entry.get("changes", {})
+        rows.append({
+            "label": label,
+            "category": entry["category"],
+            "end_value": entry.get("end_value"),
+            "last_date": entry.get("last_date"),
+            **{key: changes.get(key) for key in CHANGE_KEYS},
+            "stale": bool(entry.get("stale", False)),
+            "error": entry.get("error"),
+        })
+    frame = pd.DataFrame(rows).set_index("label")
+    frame.attrs["snapshot"] = json.dumps(_metadata(snapshot), ensure_ascii=False)
+    return frame
+
+
+def frame_to_snapshot(frame):
+    snapshot = json.loads(frame.attrs.get("snapshot", "{}"))
+    indicators = {}
+    for label, row in frame.iterrows():
+        entry = {"category": row["category"]}
+        if pd.notna(row["error"]):
+            entry["error"] = row["error"]
+        else:
+            changes = {key: float(row[key]) for key in CHANGE_KEYS if pd.notna(row[key])}
+            entry.update(end_value=float(row["end_value"]), range=changes.get("range"), changes=changes, last_date=row["last_date"])
+            if row.get("stale"):
+                entry["stale"] = True
+        indicators[label] = entry
+    snapshot["indicators"] = indicators
+    return snapshot
+
+
+def _metadata(snapshot):
+    return {key: value for key, value in snapshot.items() if key != "indicators"}
+
+
+def _format(path, fmt):
+    if fmt:
+        return fmt
+    return "parquet" if os.path.splitext(path)[1].lower() in (".parquet", ".pq") else "json"
+
+
+def _replace_file(path, write):
+    # 書き込み途中のファイルを読まれないよう、同じディレクトリの一時ファイルに write(一時ファイルのパス) で書いてから置き換える。
+    # 一時ファイル名はプロセスごとに別なので、複数のプロセスが同時に書き出しても混ざらない
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _write_json(snapshot, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False, indent=2)
+
+
+def write_snapshot(snapshot, path, fmt=None):
+    if _format(path, fmt) == "parquet":
+        _replace_file(path, snapshot_to_frame(snapshot).to_parquet)
+    else:
+        _replace_file(path, lambda tmp_path: _write_json(snapshot, tmp_path))
+
+
+def read_snapshot(path, fmt=None):
+    if _format(path, fmt) == "parquet":
+        return frame_to_snapshot(pd.read_parquet(path))
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def materialize(path=MATERIALIZED_PATH, with_analysis=False, today=None):
+    # カスタム以外の全プリセットのスナップショットを 1 つの Parquet ファイルにまとめて書き出す。
+    # 長い期間から計算し、短い期間の取得はキャッシュ済みの範囲の切り出しで済ませる
+    presets = [name for name in PRESET_OPTIONS if name != CUSTOM_PRESET]
+    snapshots = {}
+    for preset in reversed(presets):
+        start_date, end_date = preset_range(preset, today)
+        snapshots[preset] = compute_snapshot(preset, start_date, end_date, with_analysis=with_analysis)
+
+    frames = []
+    for preset in presets:
+        frame = snapshot_to_frame(snapshots[preset]).reset_index()
+        frame.insert(0, "preset", preset)
+        frames.append(frame)
+    frame = pd.concat(frames, ignore_index=True)
+    frame.attrs["snapshots"] = json.dumps(
+        {preset: _metadata(snapshots[preset]) for preset in presets}, ensure_ascii=False
+    )
+
+    _replace_file(path, lambda tmp_path: frame.to_parquet(tmp_path, index=False))
+    return snapshots
+
+
+_materialized = {"key": None, "snapshots": {}}
+_materialized_lock = threading.Lock()
+
+
+def load_materialized(path=MATERIALIZED_PATH):
+    # {プリセット: スナップショット}。ファイルが更新されるまではプロセス内で読み込み結果を使い回す
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return {}
+    key = (path, stat.st_mtime_ns, stat.st_size)
+
+    with _materialized_lock:
+        if _materialized["key"] == key:
+            return _materialized["snapshots"]
+
+        try:
+            frame = pd.read_parquet(path, memory_map=True)
+        except (OSError, ValueError) as e:
+            # 壊れた・読めないファイルは使わず、呼び出し側でその場で計算する（pyarrow の ArrowInvalid は ValueError の派生）
+            logger.warning("事前計算したスナップショットを読み込めませんでした: %s", e)
+            return {}
+        metadata = json.loads(frame.attrs.get("snapshots", "{}"))
+        snapshots = {}
+        for preset, group in frame.groupby("preset", sort=False):
+            group = group.drop(columns="preset").set_index("label")
+            group.attrs["snapshot"] = json.dumps(metadata.get(preset, {}), ensure_ascii=False)
+            snapshots[preset] = frame_to_snapshot(group)
+
+        _materialized.update(key=key, snapshots=snapshots)
+        return snapshots
+
+
+def load_preset_snapshot(range_option, start_date, end_date, path=MATERIALIZED_PATH, max_age=MATERIALIZED_MAX_AGE):
+    # 同じ期間で十分に新しい事前計算があれば返す。なければ None（呼び出し側でその場で計算する）
+    if range_option == CUSTOM_PRESET:
+        return None
+    snapshot = load_materialized(path).get(range_option)
+    if snapshot is None:
+        return None
+    if (snapshot.get("start_date"), snapshot.get("end_date")) != (start_date.date().isoformat(), end_date.date().isoformat()):
+        return None
+    generated_at = datetime.fromisoformat(snapshot["generated_at"]).timestamp()
+    if time.time() - generated_at > max_age:
+        return None
+    return snapshot
@@ -0,0 +1,53 @@
+import os
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+import pytest
+
+# テストではリポジトリの .cache を使わず、共有キャッシュもプロセス内だけにする
+_tmp = tempfile.mkdtemp(prefix="dashboard-tests-")
+os.environ.setdefault("SERIES_STORE_PATH", os.path.join(_tmp, "series.sqlite"))
+os.environ.setdefault("NEWS_STORE_PATH", os.path.join(_tmp, "news.sqlite"))
+os.environ.setdefault("ANALYSIS_CACHE_PATH", os.path.join(_tmp, "analysis.sqlite"))
+os.environ.setdefault("SNAPSHOT_PATH", os.path.join(_tmp, "snapshots.parquet"))
+os.environ.setdefault("SHARED_CACHE_URL", "memory://")
+os.environ.setdefault("CACHE_WARMER", "0")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def fresh_store(tmp_path, monkeypatch):
+    from data import store
+    from data.series_cache import series_cache
+
+    monkeypatch.setattr(store, "STORE_PATH", str(tmp_path / "series.sqlite"))
+    series_cache.clear()
+    yield
+    series_cache.clear()
+
+
+class FakeDownload:
+    # yfinance.download の代わり。営業日ごとに scale の値（overrides に日付があればその値）を返し、呼ばれた期間を記録する
+    def __init__(self):
+        self.calls = []
+        self.scale = 1.0
+        self.overrides = {}
+
+    def __call__(self, tickers, start=None, end=None, **kwargs):
+        self.calls.append((pd.Timestamp(start), pd.Timestamp(end)))
+        index = pd.date_range(start, end, freq="B", inclusive="left")
+        names = [tickers] if isinstance(tickers, str) else list(tickers)
+        columns = pd.MultiIndex.from_product([["Close"], names])
+        values = np.array([self.overrides.get(day, self.scale) for day in index])
+        return pd.DataFrame(np.repeat(values[:, None], len(names), axis=1), index=index, columns=columns)
+
+
+@pytest.fixture
+def fake_download(monkeypatch):
+    import yfinance
+
+    download = FakeDownload()
+    monkeypatch.setattr(yfinance, "download", download)
+    return download
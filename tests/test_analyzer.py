@@ -0,0 +1,92 @@
+import json
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from services import analysis_cache, analyzer
+
+
+class StubOpenAI(BaseHTTPRequestHandler):
+    # OpenAI 互換の /chat/completions。server.deltas を 1 つずつ SSE で送り、server.release が立つまで 2 つ目以降を待つ。
+    # server.fail_after を指定した場合は、その数だけ送ったところで接続を切る
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.requests += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, delta in enumerate(self.server.deltas):
+            if i == self.server.fail_after:
+                self.close_connection = True
+                return
+            if i == 1:
+                self.server.release.wait(5)
+            chunk = {
+                "id": "chatcmpl-test", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4",
+                "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}],
+            }
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+
+@pytest.fixture
+def openai_stub(monkeypatch):
+    import openai
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenAI)
+    server.deltas = ["円安", "が", "進みました。"]
+    server.fail_after = None
+    server.release = threading.Event()
+    server.requests = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(openai, "base_url", f"http://127.0.0.1:{server.server_address[1]}/v1")
+    monkeypatch.setattr(openai, "max_retries", 0)
+    yield server
+    server.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+def _inputs(name):
+    # テストごとに別のキャッシュキーになる入力
+    return {name: {"5d": 1.0, "1mo": 2.0, "3mo": 3.0, "range": 4.0}}, [], datetime(2024, 1, 1), datetime(2024, 2, 1)
+
+
+def test_stream_yields_incrementally_and_caches(openai_stub):
+    args = _inputs("stream")
+    stream = analyzer.stream_analysis(*args)
+
+    # 2 つ目のチャンクはまだ送られていないので、届いた 1 つ目だけが先に返る
+    assert next(stream) == "円安"
+    openai_stub.release.set()
+    assert list(stream) == ["が", "進みました。"]
+
+    cache_key = analyzer._make_cache_key(*args)
+    assert analysis_cache.get(cache_key) == "円安が進みました。"
+    # 2 回目はキャッシュから全文を 1 回で返し、サーバーには問い合わせない
+    assert list(analyzer.stream_analysis(*args)) == ["円安が進みました。"]
+    assert openai_stub.requests == 1
+
+
+def test_stream_error_midway_is_reported_and_not_cached(openai_stub):
+    openai_stub.fail_after = 1
+    args = _inputs("broken")
+
+    parts = list(analyzer.stream_analysis(*args))
+
+    assert parts[0] == "円安"
+    assert parts[-1].startswith("コメント生成中にエラーが発生しました")
+    assert analysis_cache.get(analyzer._make_cache_key(*args)) is None
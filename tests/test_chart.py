@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+from utils.chart import DEFAULT_MAX_POINTS, MIN_REDUCTION, downsample, minmax_indices
+
+
+def test_downsample_keeps_extremes_and_endpoints():
+    series = pd.Series(np.random.default_rng(0).normal(size=20000).cumsum(),
+                       index=pd.date_range("2000-01-01", periods=20000, freq="D"))
+    result = downsample(series)
+    assert len(result) <= DEFAULT_MAX_POINTS
+    assert result.index.is_monotonic_increasing
+    assert result.index[0] == series.index[0] and result.index[-1] == series.index[-1]
+    assert result.max() == series.max() and result.min() == series.min()
+
+
+def test_downsample_skips_small_reductions():
+    series = pd.Series(np.arange(int(DEFAULT_MAX_POINTS * MIN_REDUCTION), dtype="float64"))
+    assert len(downsample(series)) == len(series)
+
+
+def test_minmax_indices_within_threshold():
+    for n in range(3, 40):
+        for threshold in range(1, 50):
+            indices = minmax_indices(np.random.default_rng(n).random(n), threshold)
+            assert indices[0] == 0 and indices[-1] == n - 1
+            assert (np.diff(indices) > 0).all()
+            assert len(indices) <= max(threshold, 2) or len(indices) == n
+
+
+def test_comparison_chart_uses_webgl_for_many_points():
+    import plotly.graph_objects as go
+    from utils.chart import WEBGL_THRESHOLD, plot_comparison_chart, plot_line_chart
+
+    index = pd.date_range("2000-01-01", periods=100000, freq="h")
+    df = pd.DataFrame({f"c{i}": np.random.default_rng(i).normal(size=len(index)).cumsum() for i in range(3)}, index=index)
+    fig = plot_comparison_chart(df)
+    assert sum(len(trace.x) for trace in fig.data) > WEBGL_THRESHOLD
+    assert all(isinstance(trace, go.Scattergl) for trace in fig.data)
+
+    small = plot_line_chart(df.iloc[:100], "c0")
+    assert isinstance(small.data[0], go.Scatter)
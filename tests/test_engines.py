@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+from data.pyramid import SeriesPyramid, _aggregate
+from services.moving_average import MovingAverageEngine
+
+
+def _series(n=120, seed=0):
+    index = pd.date_range("2024-01-01", periods=n, freq="B", name="date")
+    return pd.Series(np.random.default_rng(seed).normal(100, 5, n), index=index)
+
+
+def _revised(series, days_back=5, delta=10.0):
+    # 末尾に 1 日追加し、days_back 日前の値を改訂した系列
+    revised = series.copy()
+    revised.iloc[-days_back] += delta
+    next_day = revised.index[-1] + pd.offsets.BDay()
+    return pd.concat([revised, pd.Series([101.0], index=pd.DatetimeIndex([next_day], name="date"))])
+
+
+def test_moving_average_applies_revisions_inside_overlap():
+    series = _series()
+    engine = MovingAverageEngine()
+    engine.update(series)
+    engine.sma([5, 20])
+    engine.ema([10])
+    engine.bollinger(20)
+
+    revised = _revised(series)
+    engine.update(revised.iloc[-30:])
+
+    sma = engine.sma([5, 20])
+    np.testing.assert_allclose(sma["MA5"], revised.rolling(5).mean(), equal_nan=True)
+    np.testing.assert_allclose(sma["MA20"], revised.rolling(20).mean(), equal_nan=True)
+    np.testing.assert_allclose(engine.ema([10])["EMA10"], revised.ewm(span=10, adjust=False).mean())
+    np.testing.assert_allclose(
+        engine.bollinger(20)["upper"], revised.rolling(20).mean() + 2 * revised.rolling(20).std(), equal_nan=True
+    )
+
+
+def test_pyramid_applies_revisions_inside_overlap():
+    series = _series()
+    pyramid = SeriesPyramid()
+    pyramid.update(series)
+
+    revised = _revised(series)
+    pyramid.update(revised.iloc[-30:])
+
+    daily = pyramid.frame("daily", revised.index[0], revised.index[-1] + pd.Timedelta(days=1))
+    np.testing.assert_allclose(daily["close"], revised)
+    for level in ("weekly", "monthly"):
+        expected = _aggregate(revised, {"weekly": "W-FRI", "monthly": "M"}[level]).set_index("date")
+        frame = pyramid.frame(level, revised.index[0], revised.index[-1] + pd.Timedelta(days=1))
+        np.testing.assert_allclose(frame[["open", "high", "low", "close"]], expected[["open", "high", "low", "close"]])
+
+
+def test_unchanged_overlap_keeps_stored_values():
+    series = _series()
+    engine = MovingAverageEngine()
+    engine.update(series)
+    before = engine.sma([5])
+    engine.update(series.iloc[-10:])
+    pd.testing.assert_frame_equal(engine.sma([5]), before)
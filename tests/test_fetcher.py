@@ -0,0 +1,55 @@
+import time
+import pandas as pd
+import pytest
+from data import fetcher, store
+from data.series_cache import series_cache
+
+
+def _expire_tail(key):
+    conn = store._connect()
+    with conn:
+        conn.execute("UPDATE coverage SET updated_at = ? WHERE key = ?", (time.time() - 2 * fetcher.YF_MAX_AGE, key))
+    conn.close()
+
+
+def test_adjustment_change_refetches_covered_range(fresh_store, fake_download):
+    # 分割・配当で過去分の調整が変わったら、末尾だけでなく取得済みの全期間を新しい値で置き換える
+    fetcher.fetch_data("SPY", "2024-01-01", "2024-04-01")
+    _expire_tail("yf:SPY")
+    series_cache.clear()
+    fake_download.scale = 0.5
+    fake_download.calls.clear()
+
+    df = fetcher.fetch_data("SPY", "2024-01-01", "2024-04-01")
+
+    assert (df["Close"] == 0.5).all()
+    assert fake_download.calls[-1][0] == pd.Timestamp("2024-01-01")
+
+
+def test_unchanged_overlap_fetches_only_tail(fresh_store, fake_download):
+    fetcher.fetch_data("SPY", "2024-01-01", "2024-04-01")
+    _expire_tail("yf:SPY")
+    series_cache.clear()
+    fake_download.calls.clear()
+
+    fetcher.fetch_data("SPY", "2024-01-01", "2024-04-01")
+
+    assert len(fake_download.calls) == 1
+    assert fake_download.calls[0][0] > pd.Timestamp("2024-03-01")
+
+
+@pytest.mark.parametrize("day", ["2024-03-27", "2024-03-29"])
+def test_single_day_revision_upserts_overlap(fresh_store, fake_download, day):
+    # 重なる日の一部だけが改訂された場合（先物の清算値・暫定の日足など）は全期間を取り直さない
+    fetcher.fetch_data("SPY", "2024-01-01", "2024-04-01")
+    _expire_tail("yf:SPY")
+    series_cache.clear()
+    fake_download.overrides = {pd.Timestamp(day): 1.5}
+    fake_download.calls.clear()
+
+    df = fetcher.fetch_data("SPY", "2024-01-01", "2024-04-01")
+
+    assert len(fake_download.calls) == 1
+    assert fake_download.calls[0][0] > pd.Timestamp("2024-03-01")
+    assert df.loc[day, "Close"] == 1.5
+    assert (df["Close"].drop(pd.Timestamp(day)) == 1.0).all()
@@ -0,0 +1,32 @@
+from data.metrics import MetricsRegistry
+
+
+def test_prometheus_exposition_format():
+    registry = MetricsRegistry()
+    registry.inc("fetch_calls_total", op="fetch_data", cache="hit", outcome="ok")
+    registry.inc("fetch_calls_total", 2, op="fetch_data", cache="miss", outcome="ok")
+    registry.observe("upstream_duration_seconds", 0.02, buckets=(0.01, 0.1, 1.0), source="yfinance")
+    registry.observe("upstream_duration_seconds", 0.5, buckets=(0.01, 0.1, 1.0), source="yfinance")
+    registry.register_collector(lambda: [("series_cache_entries", {}, 3), ("circuit_breaker_state", {"source": 'a"b'}, 2)])
+
+    lines = registry.to_prometheus().splitlines()
+
+    # カウンター（ラベルは名前順）
+    assert "# TYPE fetch_calls_total counter" in lines
+    assert any(line.startswith("# HELP fetch_calls_total ") for line in lines)
+    assert 'fetch_calls_total{cache="hit",op="fetch_data",outcome="ok"} 1' in lines
+    assert 'fetch_calls_total{cache="miss",op="fetch_data",outcome="ok"} 2' in lines
+    # ヒストグラム（バケットは累積、+Inf・_sum・_count 付き）
+    assert "# TYPE upstream_duration_seconds histogram" in lines
+    assert 'upstream_duration_seconds_bucket{source="yfinance",le="0.01"} 0' in lines
+    assert 'upstream_duration_seconds_bucket{source="yfinance",le="0.1"} 1' in lines
+    assert 'upstream_duration_seconds_bucket{source="yfinance",le="1"} 2' in lines
+    assert 'upstream_duration_seconds_bucket{source="yfinance",le="+Inf"} 2' in lines
+    assert 'upstream_duration_seconds_sum{source="yfinance"} 0.52' in lines
+    assert 'upstream_duration_seconds_count{source="yfinance"} 2' in lines
+    # ゲージ（ラベルの値はエスケープする）
+    assert "# TYPE series_cache_entries gauge" in lines
+    assert "series_cache_entries 3" in lines
+    assert 'circuit_breaker_state{source="a\\"b"} 2' in lines
+    # 同じ名前の TYPE 行は 1 回だけ
+    assert sum(line == "# TYPE fetch_calls_total counter" for line in lines) == 1
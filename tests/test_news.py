@@ -0,0 +1,145 @@
+import time
+from datetime import datetime, timedelta
+import pytest
+from data import news_fetcher, news_store
+
+
+@pytest.fixture
+def fresh_news_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(news_store, "NEWS_STORE_PATH", str(tmp_path / "news.sqlite"))
+    monkeypatch.setenv("MARKETAUX_API_KEY", "test")
+
+
+class FakePages:
+    # _fetch_page の代わり。呼ばれた引数を記録し、呼び出しごとに別の記事を per_page 件返す（found 件まで続きがある）
+    def __init__(self, per_page=1, found=1):
+        self.calls = []
+        self.per_page = per_page
+        self.found = found
+
+    def __call__(self, day, keywords, page, since=None):
+        self.calls.append((day, page, since))
+        n = len(self.calls)
+        articles = [
+            {
+                "uuid": f"a{n}-{i}", "title": f"title {n}-{i}", "description": "inflation",
+                "published_at": f"{day}T{n % 24:02d}:{i % 60:02d}:00.000000Z",
+            }
+            for i in range(self.per_page)
+        ]
+        return {"data": articles, "meta": {"found": self.found}}
+
+
+def _age_day(day, seconds):
+    conn = news_store._connect()
+    with conn:
+        conn.execute("UPDATE news_days SET updated_at = ? WHERE day = ?", (time.time() - seconds, day))
+    conn.close()
+
+
+def test_refresh_honours_warmer_interval(fresh_news_store, monkeypatch):
+    # 取得から NEWS_MAX_AGE 未満でも、事前更新の間隔を過ぎた直近の日は取り直す
+    pages = FakePages()
+    monkeypatch.setattr(news_fetcher, "_fetch_page", pages)
+    today = datetime.utcnow()
+    start, end = today - timedelta(days=1), today + timedelta(days=1)
+
+    news_fetcher.refresh_market_news(start, end, max_age=600)
+    first = len(pages.calls)
+    for day in news_store.days_between(start, end):
+        _age_day(day, 900)
+    news_fetcher.refresh_market_news(start, end, max_age=600)
+
+    assert len(pages.calls) > first
+
+
+def test_recent_day_fetches_only_newer_articles(fresh_news_store, monkeypatch):
+    pages = FakePages()
+    monkeypatch.setattr(news_fetcher, "_fetch_page", pages)
+    day = news_store.to_day(datetime.utcnow())
+    news_fetcher._fetch_day(day, news_fetcher.NEWS_FETCH_BUDGET)
+    latest = news_store.last_published(day)
+
+    pages.calls.clear()
+    news_fetcher._fetch_day(day, news_fetcher.NEWS_FETCH_BUDGET)
+
+    assert len(pages.calls) == news_fetcher.NEWS_SHARDS
+    assert all(page == 1 and since == latest for _, page, since in pages.calls)
+    assert news_store.last_published(day) is not None
+
+
+def test_burst_beyond_page_limit_leaves_day_incomplete(fresh_news_store, monkeypatch):
+    # 前回からの新しい記事がページの上限を超えた場合は、取りこぼした分を次回取り直せるよう未完了のままにする
+    pages = FakePages()
+    monkeypatch.setattr(news_fetcher, "_fetch_page", pages)
+    day = news_store.to_day(datetime.utcnow())
+    news_fetcher._fetch_day(day, news_fetcher.NEWS_FETCH_BUDGET)
+
+    pages.calls.clear()
+    pages.per_page, pages.found = news_fetcher.NEWS_PAGE_SIZE, 10 * news_fetcher.NEWS_PAGE_SIZE
+    news_fetcher._fetch_day(day, news_fetcher.NEWS_FETCH_BUDGET)
+
+    assert len(pages.calls) == news_fetcher.NEWS_SHARDS * news_fetcher.NEWS_MAX_PAGES
+    assert news_store.last_published(day) is None
+    assert news_store.missing_days([day], news_fetcher.NEWS_MAX_AGE) == [day]
+
+
+def test_backfill_is_capped_per_call(fresh_news_store, monkeypatch):
+    # 過去の日はグループごとに 1 ページだけ、1 回の呼び出しで NEWS_BACKFILL_BUDGET 件までしか取得しない
+    pages = FakePages(per_page=news_fetcher.NEWS_PAGE_SIZE, found=10 * news_fetcher.NEWS_PAGE_SIZE)
+    monkeypatch.setattr(news_fetcher, "_fetch_page", pages)
+    start, end = datetime(2020, 1, 1), datetime(2020, 2, 1)
+
+    news_fetcher._update_news_store(start, end)
+
+    assert len(pages.calls) == news_fetcher.NEWS_BACKFILL_BUDGET
+    assert all(page == 1 and since is None for _, page, since in pages.calls)
+    assert "2020-01-31" not in news_store.missing_days(news_store.days_between(start, end), news_fetcher.NEWS_MAX_AGE)
+
+
+def test_past_day_stops_after_day_budget(fresh_news_store, monkeypatch):
+    # 予算不足で途中までしか取得できない過去の日も、累計で NEWS_DAY_BUDGET 件使ったら取り直さない
+    pages = FakePages()
+    monkeypatch.setattr(news_fetcher, "_fetch_page", pages)
+    monkeypatch.setattr(news_fetcher, "NEWS_BACKFILL_BUDGET", 2)
+    start, end = datetime(2020, 1, 1), datetime(2020, 1, 2)
+
+    for _ in range(10):
+        news_fetcher._update_news_store(start, end)
+
+    assert len(pages.calls) == news_fetcher.NEWS_DAY_BUDGET
+    assert news_store.missing_days(["2020-01-01"], news_fetcher.NEWS_MAX_AGE, max_requests=news_fetcher.NEWS_DAY_BUDGET) == []
+
+
+def test_existing_store_gains_requests_column(tmp_path, monkeypatch):
+    import sqlite3
+    path = tmp_path / "old.sqlite"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE news_days (day TEXT PRIMARY KEY, updated_at REAL NOT NULL, complete INTEGER NOT NULL)")
+    conn.execute("INSERT INTO news_days VALUES ('2020-01-01', 0, 0)")
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(news_store, "NEWS_STORE_PATH", str(path))
+
+    news_store.save_day("2020-01-01", [], complete=False, requests=3)
+
+    assert news_store.missing_days(["2020-01-01"], 0, max_requests=3) == []
+
+
+def test_error_results_are_not_memoized(fresh_news_store, monkeypatch):
+    # 一時的な失敗の表示を共有キャッシュに残さず、次の呼び出しで取り直す
+    calls = []
+
+    def failing(day, keywords, page, since=None):
+        calls.append(day)
+        raise RuntimeError("temporary outage")
+
+    monkeypatch.setattr(news_fetcher, "_fetch_page", failing)
+    start, end = datetime(2021, 3, 1), datetime(2021, 3, 2)
+    first = news_fetcher.fetch_market_news(start, end)
+    assert first[0].startswith(news_fetcher.NEWS_ERROR_PREFIX)
+
+    monkeypatch.setattr(news_fetcher, "_fetch_page", FakePages())
+    second = news_fetcher.fetch_market_news(start, end)
+
+    assert not second[0].startswith(news_fetcher.NEWS_ERROR_PREFIX)
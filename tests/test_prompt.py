@@ -0,0 +1,54 @@
+from datetime import datetime
+from data.metrics import metrics
+from services import analyzer
+from services.prompt import build_prompt, count_tokens, dedupe_news, rank_news
+
+CHANGES = {
+    "S&P 500（SPY）": {"5d": 0.1, "1mo": 0.2, "3mo": 0.3, "range": 0.5},
+    "金（Gold）": {"5d": 1.0, "1mo": 3.0, "3mo": 6.0, "range": 8.0},
+}
+
+
+def test_dedupe_keeps_first_of_near_identical_headlines():
+    news = [
+        "Fed holds interest rates steady amid inflation worries (2024-01-02)\nfirst",
+        "Fed holds interest rates steady amid inflation concerns (2024-01-02)\nsecond",
+        "Oil prices jump after supply cut (2024-01-02)\nthird",
+    ]
+    assert dedupe_news(news) == [news[0], news[2]]
+
+
+def test_rank_puts_news_about_largest_move_first():
+    news = [
+        "Stocks edge higher as shares rally (2024-01-02)\nequities",
+        "Gold hits record high (2024-01-02)\ncommodity demand",
+        "Central bank minutes released (2024-01-02)\nnothing related",
+    ]
+    ranked = rank_news(news, CHANGES)
+    assert ranked == [news[1], news[0], news[2]]
+
+
+def test_news_is_truncated_to_token_budget():
+    header, section, footer = "header\n", "- indicators\n", "\nfooter"
+    news = [f"Gold story number {i} with several words of text (2024-01-02)\nbody {i}" for i in range(20)]
+    base = count_tokens(header + section + footer)
+    line = count_tokens(f"- {news[0]}\n")
+    budget = base + 3 * line
+
+    prompt, stats = build_prompt(header, section, news, CHANGES, footer, token_budget=budget)
+
+    assert stats["news_total"] == 20
+    assert 0 < stats["news_used"] <= 3
+    assert stats["untrimmed_tokens"] > stats["prompt_tokens"]
+    assert news[0] in prompt and news[-1] not in prompt
+    assert prompt.startswith(header + section) and prompt.endswith(footer)
+
+
+def test_build_prompt_records_stats_in_metrics():
+    metrics.reset()
+    news = ["Gold hits record high (2024-01-02)\nbody", "Gold hits record high (2024-01-02)\nbody again"]
+    analyzer._build_prompt(CHANGES, news, datetime(2024, 1, 1), datetime(2024, 2, 1))
+
+    items = {dict(labels)["stage"]: value for labels, value in metrics.counters("analysis_news_items_total").items()}
+    assert items == {"total": 2, "unique": 1, "used": 1}
+    assert sum(h.count for h in metrics.histograms("analysis_prompt_tokens").values()) == 1
@@ -0,0 +1,106 @@
+import pytest
+from data import resilience
+from data.resilience import CircuitBreaker, CircuitOpenError, NegativeCache, backoff_delay, call_with_retry
+
+
+class FakeClock:
+    # resilience の time の代わり。sleep は待たずに時刻だけ進め、待った秒数を記録する
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience, "time", clock)
+    return clock
+
+
+def test_breaker_opens_half_opens_and_closes(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=60)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    # reset_timeout が経つまでは遮断を続け、経ったら 1 回だけ試しに通す
+    clock.advance(59)
+    assert not breaker.allow()
+    clock.advance(1)
+    assert breaker.allow()
+    assert breaker.state == "half-open"
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+    assert breaker.stats()["rejected"] == 3
+
+
+def test_failed_trial_reopens_breaker(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.advance(10)
+    assert breaker.allow()
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    clock.advance(10)
+    assert breaker.allow()
+
+
+def test_backoff_delay_stays_within_full_jitter_bounds():
+    for attempt in range(8):
+        upper = min(30.0, 2 * 2 ** attempt)
+        delays = [backoff_delay(attempt, 2, max_delay=30.0) for _ in range(200)]
+        assert all(0 <= delay <= upper for delay in delays)
+        assert max(delays) > upper / 2
+
+
+def test_call_with_retry_backs_off_then_rejects_when_open(clock, monkeypatch):
+    monkeypatch.setitem(resilience._breakers, "flaky", CircuitBreaker("flaky", failure_threshold=3, reset_timeout=60))
+    calls = []
+
+    def failing():
+        calls.append(clock.now)
+        raise ConnectionError("down")
+
+    with pytest.raises(ConnectionError):
+        call_with_retry("flaky", failing, retries=3, base_delay=1)
+    assert len(calls) == 3
+    assert [delay <= 1 * 2 ** i for i, delay in enumerate(clock.sleeps)] == [True, True]
+
+    # 連続失敗で遮断された後は取得元を呼ばずにすぐ失敗する
+    with pytest.raises(CircuitOpenError):
+        call_with_retry("flaky", failing, retries=3, base_delay=1)
+    assert len(calls) == 3
+
+
+def test_negative_cache_expires(clock):
+    cache = NegativeCache(ttl=300)
+    cache.add("yf:XXX", "no data")
+    assert cache.get("yf:XXX") == "no data"
+    clock.advance(300)
+    assert cache.get("yf:XXX") == "no data"
+    clock.advance(1)
+    assert cache.get("yf:XXX") is None
+
+    cache.add("yf:XXX", "no data")
+    cache.discard("yf:XXX")
+    assert cache.get("yf:XXX") is None
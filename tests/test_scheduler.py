@@ -0,0 +1,35 @@
+import threading
+import time
+from data.scheduler import FetchScheduler
+
+
+def test_busy_source_does_not_delay_other_sources():
+    scheduler = FetchScheduler({"slow": 2, "fast": 1})
+    release = threading.Event()
+    blocked = [scheduler.submit("slow", release.wait) for _ in range(20)]
+
+    started = time.time()
+    assert scheduler.submit("fast", lambda: "ok").result(timeout=1) == "ok"
+    assert time.time() - started < 0.5
+
+    release.set()
+    for future in blocked:
+        future.result(timeout=5)
+
+
+def test_source_concurrency_is_capped():
+    scheduler = FetchScheduler({"capped": 2})
+    lock = threading.Lock()
+    running = [0, 0]  # 実行中の数, 最大値
+
+    def task():
+        with lock:
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+
+    for future in [scheduler.submit("capped", task) for _ in range(8)]:
+        future.result(timeout=5)
+    assert running[1] == 2
@@ -0,0 +1,59 @@
+import pandas as pd
+from data.series_cache import ENTRY_OVERHEAD, CompactSeries, SeriesCache
+
+
+def _series(days, start="2024-01-01"):
+    index = pd.date_range(start, periods=days, freq="D")
+    return CompactSeries.from_series(pd.Series(range(days), index=index, dtype="float64"))
+
+
+def _entry_bytes(days):
+    return _series(days).nbytes + ENTRY_OVERHEAD
+
+
+def test_evicts_least_recently_used_first():
+    cache = SeriesCache(max_bytes=2 * _entry_bytes(10))
+    cache.put("a", _series(10), "2024-01-01", "2024-01-11", 60)
+    cache.put("b", _series(10), "2024-01-01", "2024-01-11", 60)
+    # a を参照すると、次に追加した時に追い出されるのは b になる
+    assert cache.get("a", "2024-01-01", "2024-01-05") is not None
+    cache.put("c", _series(10), "2024-01-01", "2024-01-11", 60)
+
+    assert cache.get("b", "2024-01-01", "2024-01-05") is None
+    assert cache.get("a", "2024-01-01", "2024-01-05") is not None
+    assert cache.get("c", "2024-01-01", "2024-01-05") is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.total_bytes <= cache.max_bytes
+
+
+def test_expired_entries_are_evicted_before_recent_ones():
+    cache = SeriesCache(max_bytes=2 * _entry_bytes(10))
+    cache.put("old", _series(10), "2024-01-01", "2024-01-11", -1)
+    cache.put("a", _series(10), "2024-01-01", "2024-01-11", 60)
+    cache.get("old", "2024-01-01", "2024-01-05")
+    cache.put("b", _series(10), "2024-01-01", "2024-01-11", 60)
+
+    assert cache.stats()["entries"] == 2
+    assert cache.get("a", "2024-01-01", "2024-01-05") is not None
+
+
+def test_oversize_series_is_rejected_and_replaces_nothing():
+    cache = SeriesCache(max_bytes=_entry_bytes(100))
+    cache.put("a", _series(10), "2024-01-01", "2024-01-11", 60)
+    cache.put("a", _series(1000), "2024-01-01", "2025-01-01", 60)
+
+    # 上限より大きい系列は保持せず、同じキーの古い範囲も残さない
+    assert cache.get("a", "2024-01-01", "2024-01-05") is None
+    assert cache.total_bytes == 0
+    cache.put("b", _series(10), "2024-01-01", "2024-01-11", 60)
+    assert cache.total_bytes == _entry_bytes(10)
+
+
+def test_extend_range_merges_with_cached_range():
+    cache = SeriesCache(max_bytes=10 * _entry_bytes(100))
+    assert cache.extend_range("a", "2024-02-01", "2024-03-01") == (pd.Timestamp("2024-02-01"), pd.Timestamp("2024-03-01"))
+    cache.put("a", _series(31), "2024-01-01", "2024-02-01", 60)
+
+    assert cache.extend_range("a", "2024-02-01", "2024-03-01") == (pd.Timestamp("2024-01-01"), pd.Timestamp("2024-03-01"))
+    assert cache.get("a", "2024-01-10", "2024-03-01") is None
+    assert len(cache.get("a", "2024-01-10", "2024-01-20")) == 10
@@ -0,0 +1,168 @@
+import fnmatch
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+from data import shared_cache as sc
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeRedis:
+    # RedisBackend が使う redis.Redis のメソッドだけを辞書で再現する（期限は秒単位の時刻で管理）
+    def __init__(self, clock):
+        self.clock = clock
+        self.values = {}
+
+    def _alive(self, key):
+        entry = self.values.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= self.clock.time():
+            del self.values[key]
+            return None
+        return entry
+
+    def get(self, key):
+        entry = self._alive(key)
+        return None if entry is None else entry[0]
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        if nx and self._alive(key) is not None:
+            return None
+        ttl = ex if ex is not None else (px / 1000 if px is not None else None)
+        self.values[key] = (value.encode() if isinstance(value, str) else value,
+                            None if ttl is None else self.clock.time() + ttl)
+        return True
+
+    def scan_iter(self, match):
+        return [key for key in list(self.values) if fnmatch.fnmatchcase(key, match)]
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+    def eval(self, script, numkeys, key, owner):
+        # RedisBackend._UNLOCK_SCRIPT: 持ち主が一致する場合だけ消す
+        if self.get(key) == owner.encode():
+            self.delete(key)
+            return 1
+        return 0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(sc, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path, clock):
+    if request.param == "memory":
+        return sc.MemoryBackend()
+    if request.param == "sqlite":
+        return sc.SQLiteBackend(str(tmp_path / "shared.sqlite"))
+    return sc.RedisBackend(client=FakeRedis(clock))
+
+
+def test_backend_round_trip_and_expiry(backend, clock):
+    backend.set("memo:a:1", b"one", 10)
+    backend.set("memo:a:2", b"two", 10)
+    backend.set("memo:b:1", b"three", 10)
+    assert backend.get("memo:a:1") == b"one"
+
+    backend.delete_prefix("memo:a:")
+    assert backend.get("memo:a:1") is None and backend.get("memo:a:2") is None
+    assert backend.get("memo:b:1") == b"three"
+
+    clock.sleep(11)
+    assert backend.get("memo:b:1") is None
+
+
+def test_backend_lock_excludes_other_owners(backend, clock):
+    assert backend.try_lock("fetch", "p1", 5)
+    assert not backend.try_lock("fetch", "p2", 5)
+    # 持ち主以外は解放できない
+    backend.unlock("fetch", "p2")
+    assert not backend.try_lock("fetch", "p2", 5)
+    backend.unlock("fetch", "p1")
+    assert backend.try_lock("fetch", "p2", 5)
+    # 持ち主が落ちても ttl が過ぎれば他のプロセスが取れる
+    clock.sleep(6)
+    assert backend.try_lock("fetch", "p3", 5)
+
+
+@pytest.fixture
+def memory_backend():
+    backend = sc.MemoryBackend()
+    sc.set_backend(backend)
+    yield backend
+    sc.set_backend(None)
+
+
+def test_shared_lock_serializes_threads(memory_backend):
+    inside = []
+    overlap = []
+
+    def worker():
+        with sc.shared_lock("job", wait=5) as acquired:
+            assert acquired
+            if inside:
+                overlap.append(True)
+            inside.append(1)
+            threading.Event().wait(0.05)
+            inside.pop()
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not overlap
+
+
+def test_shared_cache_memoizes_and_skips_rejected_values(memory_backend):
+    calls = []
+
+    @sc.shared_cache(ttl=60, cache_if=lambda value: value != "error")
+    def compute(x):
+        calls.append(x)
+        return "error" if x < 0 else {"x": x}
+
+    assert compute(1) == {"x": 1}
+    assert compute(1) == {"x": 1}
+    assert compute(-1) == "error"
+    assert compute(-1) == "error"
+    assert calls == [1, -1, -1]
+
+    compute.refresh(1)
+    assert calls[-1] == 1
+    compute.clear()
+    compute(1)
+    assert calls == [1, -1, -1, 1, 1]
+
+
+def test_frame_codec_round_trip(memory_backend):
+    frame = pd.DataFrame(
+        {"value": [1.5, np.nan, 3.0], "label": ["a", None, "c"]},
+        index=pd.date_range("2024-01-01", periods=3, name="date"),
+    )
+    calls = []
+
+    @sc.shared_cache(ttl=60, codec=sc.FrameCodec)
+    def load():
+        calls.append(1)
+        return frame
+
+    load()
+    cached = load()
+
+    assert len(calls) == 1
+    pd.testing.assert_frame_equal(cached, frame, check_dtype=False, check_freq=False)
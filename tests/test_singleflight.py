@@ -0,0 +1,75 @@
+import threading
+import pytest
+from data.singleflight import SingleFlight
+
+CALLERS = 8
+
+
+def _run_concurrently(flight, fn):
+    # CALLERS 個のスレッドから同じキーで同時に呼び、(結果, 例外) のリストを返す
+    results = []
+    lock = threading.Lock()
+
+    def caller():
+        try:
+            value, error = flight.do("key", fn), None
+        except Exception as e:
+            value, error = None, e
+        with lock:
+            results.append((value, error))
+
+    threads = [threading.Thread(target=caller) for _ in range(CALLERS)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def _wait_for_waiters(flight):
+    # 先頭の呼び出しが実行中の間に、残りが全員合流するのを待つ
+    for _ in range(500):
+        if flight.stats()["coalesced"] == CALLERS - 1:
+            return
+        threading.Event().wait(0.01)
+    pytest.fail("callers did not coalesce")
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return {"rows": 3}
+
+    threads, results = _run_concurrently(flight, fetch)
+    _wait_for_waiters(flight)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert [value for value, _ in results] == [{"rows": 3}] * CALLERS
+    assert len({id(value) for value, _ in results}) == 1
+    assert flight.stats() == {"executed": 1, "coalesced": CALLERS - 1, "in_flight": 0}
+
+
+def test_exception_reaches_every_waiter():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fetch():
+        release.wait(5)
+        raise ConnectionError("upstream down")
+
+    threads, results = _run_concurrently(flight, fetch)
+    _wait_for_waiters(flight)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == CALLERS
+    assert all(isinstance(error, ConnectionError) for _, error in results)
+    # 失敗した呼び出しは残らず、次の呼び出しは新しく実行される
+    assert flight.do("key", lambda: "ok") == "ok"
@@ -0,0 +1,29 @@
+from datetime import datetime
+from services import snapshot
+
+
+def _snapshot():
+    return {
+        "version": snapshot.SNAPSHOT_VERSION,
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "range_option": "1ヶ月",
+        "start_date": "2024-01-01",
+        "end_date": "2024-02-01",
+        "indicators": {"S&P 500（SPY）": {"category": "株式", "error": "のデータが空です。"}},
+    }
+
+
+def test_corrupt_materialized_file_falls_back(tmp_path):
+    # 書き込みが混ざって壊れたファイルは例外にせず、その場で計算する側に回す
+    path = tmp_path / "snapshots.parquet"
+    path.write_bytes(b"PAR1 not really parquet")
+    assert snapshot.load_materialized(str(path)) == {}
+    assert snapshot.load_preset_snapshot("1ヶ月", datetime(2024, 1, 1), datetime(2024, 2, 1), path=str(path)) is None
+
+
+def test_write_snapshot_leaves_no_temporary_files(tmp_path):
+    for name in ("snapshot.json", "snapshot.parquet"):
+        path = tmp_path / name
+        snapshot.write_snapshot(_snapshot(), str(path))
+        assert snapshot.read_snapshot(str(path))["indicators"].keys() == _snapshot()["indicators"].keys()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["snapshot.json", "snapshot.parquet"]
@@ -0,0 +1,35 @@
+import pandas as pd
+from data import fetcher, store
+from data.series_cache import series_cache
+
+
+def test_disjoint_range_leaves_no_covered_gap(fresh_store, fake_download):
+    # 離れた期間を取得した後でも、その間の期間が取得済み扱いにならない
+    fetcher.fetch_data("SPY", "2020-01-01", "2020-04-01")
+    series_cache.clear()
+    fetcher.fetch_data("SPY", "2025-01-01", "2025-04-01")
+    series_cache.clear()
+
+    df = fetcher.fetch_data("SPY", "2022-01-01", "2022-04-01")
+
+    assert len(df) == len(pd.date_range("2022-01-01", "2022-04-01", freq="B", inclusive="left"))
+
+
+def test_missing_ranges_extends_contiguously(fresh_store):
+    store.save_series("k", pd.Series([1.0], index=pd.to_datetime(["2020-01-02"])), "2020-01-01", "2020-02-01")
+
+    assert store.missing_ranges("k", "2019-01-01", "2019-02-01", max_age=3600) == [
+        (pd.Timestamp("2019-01-01"), pd.Timestamp("2020-01-01")),
+    ]
+    tail = store.missing_ranges("k", "2021-01-01", "2021-02-01", max_age=3600)
+    assert tail[-1][1] == pd.Timestamp("2021-02-01")
+    assert tail[-1][0] <= pd.Timestamp("2020-02-01")
+
+
+def test_backfill_does_not_refresh_tail(fresh_store):
+    store.save_series("k", pd.Series([1.0], index=pd.to_datetime(["2020-01-02"])), "2020-01-01", "2020-02-01")
+    first = store.get_coverage("k").updated_at
+
+    store.save_series("k", pd.Series([2.0], index=pd.to_datetime(["2019-06-03"])), "2019-06-01", "2020-01-01")
+
+    assert store.get_coverage("k").updated_at == first
@@ -0,0 +1,42 @@
+import threading
+from data.warmer import CacheWarmer, WarmJob
+
+
+def test_followup_runs_after_successful_job():
+    # then で指定したジョブは起動直後には実行せず、元のジョブが成功した後に実行される
+    order = []
+    done = threading.Event()
+
+    def fetch():
+        order.append("fetch")
+
+    def snapshot():
+        order.append("snapshot")
+        done.set()
+
+    warmer = CacheWarmer([
+        WarmJob("fetch", "test-fetch", 3600, fetch, then=("snapshot",)),
+        WarmJob("snapshot", "test-snapshot", 3600, snapshot),
+    ])
+    warmer.start()
+
+    assert done.wait(5)
+    assert order == ["fetch", "snapshot"]
+
+
+def test_failed_job_does_not_trigger_followup():
+    ran = threading.Event()
+    failed = threading.Event()
+
+    def fetch():
+        failed.set()
+        raise RuntimeError("upstream down")
+
+    warmer = CacheWarmer([
+        WarmJob("fetch", "test-fetch", 3600, fetch, then=("snapshot",)),
+        WarmJob("snapshot", "test-snapshot", 3600, ran.set),
+    ], retry_delay=3600)
+    warmer.start()
+
+    assert failed.wait(5)
+    assert not ran.wait(0.5)
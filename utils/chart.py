@@ -1,11 +1,58 @@
-import plotly.express as px
-
-def plot_comparison_chart(df, title="\U0001F4C8 指標の相対変化比較グラフ"):
-    fig = px.line(
-        df,
-        x=df.index,
-        y=df.columns,
-        labels={"value": "変化率（初期値=100）", "variable": "指標"},
-        title=title
+import numpy as np
+import plotly.graph_objects as go
+
+# 1 トレースあたりの最大描画点数（グラフ幅の px 程度）と、WebGL 描画に切り替える図全体の点数
+DEFAULT_MAX_POINTS = 800
+WEBGL_THRESHOLD = 1000
+MIN_REDUCTION = 1.25  # 点数が max_points のこの倍数以下なら間引かずにそのまま描く
+
+def minmax_indices(y, threshold):
+    # 両端を残し、間を threshold // 2 - 1 個の区間に分けて各区間の最小・最大の点を残す（残す点の位置を返す）
+    n = len(y)
+    buckets = threshold // 2 - 1
+    if threshold >= n or buckets < 1:
+        return np.arange(n)
+
+    inner = y[1:-1]
+    size = -(-len(inner) // buckets)
+    # 最後の区間の足りない分は末尾の値で埋め、選ばれた位置は実在する点に丸める
+    padded = np.pad(inner, (0, size * -(-len(inner) // size) - len(inner)), mode="edge").reshape(-1, size)
+    offsets = np.arange(len(padded)) * size
+    picked = np.concatenate([offsets + padded.argmin(axis=1), offsets + padded.argmax(axis=1)])
+    picked = np.minimum(picked, len(inner) - 1) + 1
+    return np.unique(np.concatenate([[0, n - 1], picked]))
+
+def downsample(series, max_points=DEFAULT_MAX_POINTS):
+    # 欠損を除いた系列を max_points 点以下に間引く（減る点数が少ない場合はそのまま返す）
+    series = series.dropna()
+    if max_points is None or len(series) <= max_points * MIN_REDUCTION:
+        return series
+    return series.iloc[minmax_indices(series.to_numpy(dtype="float64"), max_points)]
+
+def use_webgl(total_points):
+    # 図全体（全トレースの合計）の点数が多い場合は WebGL（Scattergl）で描画する
+    return total_points > WEBGL_THRESHOLD
+
+def line_trace(series, name, max_points=DEFAULT_MAX_POINTS, webgl=False, **kwargs):
+    # 間引いた折れ線トレース。webgl は図全体の点数から use_webgl で決めて渡す
+    series = downsample(series, max_points)
+    trace_class = go.Scattergl if webgl else go.Scatter
+    return trace_class(x=series.index, y=series.to_numpy(), mode="lines", name=name, **kwargs)
+
+def plot_line_chart(df, column, max_points=DEFAULT_MAX_POINTS):
+    series = downsample(df[column], max_points)
+    fig = go.Figure(line_trace(series, column, max_points=None, webgl=use_webgl(len(series))))
+    fig.update_layout(xaxis_title="date", yaxis_title=column)
+    return fig
+
+def plot_comparison_chart(df, title="\U0001F4C8 指標の相対変化比較グラフ", max_points=DEFAULT_MAX_POINTS):
+    columns = {column: downsample(df[column], max_points) for column in df.columns}
+    webgl = use_webgl(sum(len(series) for series in columns.values()))
+    fig = go.Figure([line_trace(series, column, max_points=None, webgl=webgl) for column, series in columns.items()])
+    fig.update_layout(
+        title=title,
+        xaxis_title="date",
+        yaxis_title="変化率（初期値=100）",
+        legend_title_text="指標"
     )
-    return fig
\ No newline at end of file
+    return fig
@@ -0,0 +1,102 @@
+import ast
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+# Streamlit のエントリポイントの起動コストを測る。
+#   cold: 新しいインタプリタでスクリプトの import をすべて読み込むまでの時間（python -c pass との差）
+#   rerun: 一度実行したスクリプトを AppTest で再実行する時間（キャッシュが温まった状態のスクリプト自体のオーバーヘッド）
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINTS = ["app.py", "pages/indicators_chart.py", "pages/detail_chart.py"]
+RERUN_QUERY_PARAMS = {"pages/detail_chart.py": {"symbol": "S&P 500（SPY）"}}
+HEAVY_MODULES = ["yfinance", "openai", "requests", "plotly", "pyarrow", "tiktoken", "redis"]
+
+_IMPORT_TIME = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)")
+
+
+def entry_imports(path):
+    # スクリプトの先頭レベルの import 文が読み込むモジュール
+    with open(os.path.join(ROOT, path), encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+def _run_python(code, env):
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    elapsed = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+    return elapsed, proc.stderr
+
+
+def _top_imports(importtime_log, limit):
+    # 先頭レベルの import ごとの累積時間（ミリ秒）が大きい順
+    totals = {}
+    for line in importtime_log.splitlines():
+        match = _IMPORT_TIME.match(line)
+        if match and len(match.group(3)) == 1:
+            totals[match.group(4)] = int(match.group(2)) / 1000
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+def measure_cold(path, runs=5, top=5):
+    # API キーを外した環境で測り、読み込み時に設定を要求するモジュールがないことも確かめる
+    env = {k: v for k, v in os.environ.items() if k not in ("OPENAI_API_KEY", "MARKETAUX_API_KEY")}
+    env["CACHE_WARMER"] = "0"
+    modules = entry_imports(path)
+    code = "; ".join(f"import {module}" for module in modules)
+    probe = f"; import sys; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules), file=sys.stderr)"
+
+    baseline = statistics.median(_run_python("pass", env)[0] for _ in range(runs))
+    samples = []
+    log = ""
+    for _ in range(runs):
+        elapsed, log = _run_python(code + probe, env)
+        samples.append(elapsed)
+    loaded = log.strip().splitlines()[-1]
+    return {
+        "entry_point": path,
+        "cold_ms": round((statistics.median(samples) - baseline) * 1000, 1),
+        "interpreter_ms": round(baseline * 1000, 1),
+        "heavy_modules": [m for m in loaded.split(",") if m],
+        "top_imports_ms": _top_imports(log, top),
+    }
+
+
+def measure_rerun(path, runs=5, timeout=120):
+    # 最初の実行（取得・キャッシュの準備）は除き、その後の再実行の中央値を返す
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT, path), default_timeout=timeout)
+    for key, value in RERUN_QUERY_PARAMS.get(path, {}).items():
+        at.query_params[key] = value
+    at.run()
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        at.run()
+        samples.append(time.perf_counter() - started)
+    return {"entry_point": path, "rerun_ms": round(statistics.median(samples) * 1000, 1)}
+
+
+def run_benchmark(entry_points=ENTRY_POINTS, runs=5, reruns=0):
+    results = []
+    for path in entry_points:
+        result = measure_cold(path, runs=runs)
+        if reruns:
+            result.update(measure_rerun(path, runs=reruns))
+        results.append(result)
+    return results